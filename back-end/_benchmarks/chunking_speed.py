@@ -0,0 +1,56 @@
+import os
+import sys
+import json
+import time
+import argparse
+from transformers import AutoTokenizer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.chunking import Chunker, MIN_TOKENS, MAX_TOKENS
+
+# Chunking speed of the Chunker (app/chunking.py) over the sections of the first
+# rulings in the corpus. Parity with the previous re-tokenizing implementation
+# is pinned by tests/test_chunking.py.
+# Run from back-end/_benchmarks.
+
+INPUT_DIR = "../_data/rechtspraak-json"
+
+tokenizer = AutoTokenizer.from_pretrained("intfloat/multilingual-e5-large")
+
+
+def load_sections(input_dir: str, limit: int) -> list[list[str]]:
+    filenames = sorted(name for name in os.listdir(input_dir) if name.endswith(".json"))[:limit]
+    sections = []
+    for filename in filenames:
+        with open(os.path.join(input_dir, filename), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for sec in data.get("fullText", []):
+            paras = [p.strip() for p in sec.get("paragraphs", []) if p.strip()]
+            if paras:
+                sections.append(paras)
+    return sections
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=500, help="Rulings to chunk (sorted by file name)")
+    args = parser.parse_args()
+
+    sections = load_sections(INPUT_DIR, args.files)
+    n_paragraphs = sum(len(paras) for paras in sections)
+    print(f"{args.files} rulings, {len(sections)} sections, {n_paragraphs} paragraphs\n")
+
+    chunker = Chunker(tokenizer, MIN_TOKENS, MAX_TOKENS)
+    start = time.perf_counter()
+    n_chunks = 0
+    for paras in sections:
+        n_chunks += len(chunker.chunk_paragraphs(paras))
+        chunker.reset()
+    seconds = time.perf_counter() - start
+
+    print(f"{'seconds':>8} {'sections/s':>11} {'paragraphs/s':>13} {'chunks':>7}")
+    print(f"{seconds:>8.2f} {len(sections) / seconds:>11.1f} {n_paragraphs / seconds:>13.1f} {n_chunks:>7}")
+
+
+if __name__ == "__main__":
+    main()
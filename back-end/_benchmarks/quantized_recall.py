@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.prompt import build_query
+from app.rag import aembed_query
+from app.vector_index import LocalVectorIndex
+from app.quantized_index import build_quantized_index, QuantizedVectorIndex, QUANTIZATION_KINDS
+
+# Recall@k of the quantized backend (coarse search on int8/binary codes, optionally
+# PCA-reduced, then exact rescoring) against exact search on the flat index, for
+# the evaluation cases in 0_input_cases.json. Also reports memory and latency.
+# Run from back-end/_benchmarks after building ../_data/vector_index.
+
+VECTOR_INDEX_DIR = "../_data/vector_index"
+INPUT_CASES_FILE = "../_evaluation/data/0_input_cases.json"
+REDUCED_DIMS = [None, 256, 128]
+RESCORE_FACTORS = [2, 4, 10]
+
+
+def timed_search(index, queries: np.ndarray, k: int) -> tuple[list[set], float]:
+    start = time.perf_counter()
+    results = [{r["id"] for r in index.search(q, k, 2.0)} for q in queries]
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+async def embed_cases(cases: list[dict]) -> np.ndarray:
+    return np.stack([await aembed_query(build_query(case["formData"])) for case in cases])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(INPUT_CASES_FILE, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    queries = asyncio.run(embed_cases(cases))
+
+    flat = LocalVectorIndex(VECTOR_INDEX_DIR)
+    exact, flat_latency = timed_search(flat, queries, args.k)
+    print(f"{len(queries)} queries, {len(flat)} chunks, float32 vectors: {flat.vectors.nbytes / 2**20:.1f} MiB")
+    print(f"exact flat search: {flat_latency * 1000:.2f} ms/query\n")
+
+    print(f"{'kind':<7} {'dims':>5} {'rescore':>7} {'recall@%d' % args.k:>9} {'codes_MiB':>9} {'saved':>6} {'ms/query':>8}")
+    for kind in QUANTIZATION_KINDS:
+        for reduced_dim in REDUCED_DIMS:
+            with tempfile.TemporaryDirectory() as out_dir:
+                stats = build_quantized_index(VECTOR_INDEX_DIR, kind, reduced_dim, out_dir=out_dir)
+                saved = 1 - stats["code_bytes"] / stats["float32_bytes"]
+                for factor in RESCORE_FACTORS:
+                    index = QuantizedVectorIndex(VECTOR_INDEX_DIR, rescore_factor=factor, quantized_dir=out_dir)
+                    found, latency = timed_search(index, queries, args.k)
+                    recall = np.mean([len(f & e) / max(len(e), 1) for f, e in zip(found, exact)])
+                    print(
+                        f"{kind:<7} {reduced_dim or flat.vectors.shape[1]:>5} {factor:>7} {recall:>9.3f} "
+                        f"{stats['code_bytes'] / 2**20:>9.1f} {saved:>6.1%} {latency * 1000:>8.2f}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
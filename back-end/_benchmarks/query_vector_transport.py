@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import base64
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.vector_codec import VECTOR_ENCODINGS, encode_vector, decode_vector
+from app.vector_index import LocalVectorIndex, VectorIndexWriter
+
+# Compares the query-vector wire formats of app/vector_codec.py:
+#   - payload size and encode/decode time against the current text path
+#   - bit-exactness of the decode_query_vector SQL arithmetic (emulated in numpy,
+#     or run in a real pgvector database when --dsn is given)
+#   - whether the decoded query retrieves the same top-k from the local index,
+#     standing in for pgvector
+# Run from back-end/_benchmarks.
+
+VECTOR_INDEX_DIR = "../_data/vector_index"
+SYNTHETIC_INDEX_DIR = "../_data/benchmark_vector_index"
+DIM = 1024
+TOP_K = 6
+
+
+def timed(fn, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+# Same IEEE 754 field arithmetic as decode_query_vector in
+# _utils/supabase_decode_query_vector.sql
+def sql_reference_decode(payload: str, encoding: str) -> np.ndarray:
+    width, bias, mantissa_bits = (2, 15, 10) if encoding == "f16b64" else (4, 127, 23)
+    b = np.frombuffer(base64.b64decode(payload), dtype=np.uint8).astype(np.int64).reshape(-1, width)
+    w = sum(b[:, k] << (8 * k) for k in range(width))
+
+    sign = (w >> (8 * width - 1)) & 1
+    exponent = (w >> mantissa_bits) & ((1 << (8 * width - 1 - mantissa_bits)) - 1)
+    mantissa = w & ((1 << mantissa_bits) - 1)
+    value = np.where(
+        exponent == 0,
+        mantissa * 2.0 ** (1 - bias - mantissa_bits),
+        (1 + mantissa / 2.0 ** mantissa_bits) * 2.0 ** (exponent - bias)
+    )
+    return ((1 - 2 * sign) * value).astype(np.float32)
+
+
+def postgres_decode(dsn: str, payload: str, encoding: str) -> np.ndarray:
+    import psycopg
+    with psycopg.connect(dsn) as conn:
+        row = conn.execute(
+            "SELECT decode_query_vector(%s, %s)::text", (payload, encoding)
+        ).fetchone()
+    return decode_vector(row[0], "text")
+
+
+def load_index(synthetic_rows: int) -> LocalVectorIndex:
+    if os.path.exists(os.path.join(VECTOR_INDEX_DIR, "manifest.json")):
+        return LocalVectorIndex(VECTOR_INDEX_DIR)
+
+    print(f"No index at {VECTOR_INDEX_DIR}, using {synthetic_rows} synthetic vectors")
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(synthetic_rows, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    rows = [
+        {"id": str(i), "ecli": f"ECLI:{i}", "content": "", "metadata": {}}
+        for i in range(synthetic_rows)
+    ]
+    writer = VectorIndexWriter(SYNTHETIC_INDEX_DIR, DIM)
+    writer.append(rows, vectors)
+    writer.finish("synthetic")
+    return LocalVectorIndex(SYNTHETIC_INDEX_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--synthetic-rows", type=int, default=20000)
+    parser.add_argument("--dsn", help="Postgres DSN with decode_query_vector installed")
+    args = parser.parse_args()
+
+    index = load_index(args.synthetic_rows)
+    rng = np.random.default_rng(1)
+    # Queries near stored vectors, like real questions about the corpus
+    picks = rng.choice(len(index), size=args.queries)
+    queries = np.asarray(index.vectors[picks]) + rng.normal(scale=0.02, size=(args.queries, index.vectors.shape[1]))
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+    baseline = [[r["id"] for r in index.search(q, TOP_K, 2.0)] for q in queries]
+
+    print(f"{'encoding':<8} {'bytes':>7} {'encode_us':>10} {'decode_us':>10} {'max_abs_err':>12} {'sql_exact':>9} {'top%d_overlap' % TOP_K:>12}")
+    for encoding in VECTOR_ENCODINGS:
+        payloads = [encode_vector(q, encoding) for q in queries]
+        size = np.mean([len(p.encode("utf-8")) for p in payloads])
+        encode_s = np.mean([timed(lambda q=q: encode_vector(q, encoding), args.repeats) for q in queries[:20]])
+        decode_s = np.mean([timed(lambda p=p: decode_vector(p, encoding), args.repeats) for p in payloads[:20]])
+
+        decoded = [decode_vector(p, encoding) for p in payloads]
+        max_err = float(np.max(np.abs(np.stack(decoded) - queries)))
+
+        if encoding == "text":
+            sql_exact = "-"
+        elif args.dsn:
+            sql_exact = all(np.array_equal(postgres_decode(args.dsn, p, encoding), d) for p, d in zip(payloads[:20], decoded))
+        else:
+            sql_exact = all(np.array_equal(sql_reference_decode(p, encoding), d) for p, d in zip(payloads, decoded))
+
+        overlap = np.mean([
+            len(set(base) & {r["id"] for r in index.search(d, TOP_K, 2.0)}) / TOP_K
+            for base, d in zip(baseline, decoded)
+        ])
+        print(f"{encoding:<8} {size:>7.0f} {encode_s * 1e6:>10.1f} {decode_s * 1e6:>10.1f} {max_err:>12.2e} {str(sql_exact):>9} {overlap:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
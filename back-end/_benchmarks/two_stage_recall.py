@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.prompt import build_query
+from app.rag import aembed_query
+from app.two_stage_index import TwoStageVectorIndex
+
+# Recall@k of the two-stage backend (rank rulings by abstract, then search their
+# OVERWEGINGEN/BESLISSING chunks) against exact flat search for the evaluation
+# cases in 0_input_cases.json, plus vectors scored and latency per query.
+# Two baselines: flat search over every chunk, and flat search over only the
+# second-stage chunks (isolates what the ruling shortlist loses).
+# Run from back-end/_benchmarks after _pipeline/7_build_ruling_index.py.
+
+VECTOR_INDEX_DIR = "../_data/vector_index"
+INPUT_CASES_FILE = "../_evaluation/data/0_input_cases.json"
+CANDIDATE_RULINGS = [5, 10, 20, 50, 100]
+
+
+async def embed_cases(cases: list[dict]) -> np.ndarray:
+    return np.stack([await aembed_query(build_query(case["formData"])) for case in cases])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(INPUT_CASES_FILE, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    queries = asyncio.run(embed_cases(cases))
+
+    index = TwoStageVectorIndex(VECTOR_INDEX_DIR)
+    flat = index.flat
+    stage2_only = np.zeros(len(flat), dtype=bool)
+    stage2_only[index.stage2_rows] = True
+
+    start = time.perf_counter()
+    exact_all = [[r["id"] for r in flat.search(q, args.k, 2.0)] for q in queries]
+    flat_latency = (time.perf_counter() - start) / len(queries)
+
+    exact_stage2 = []
+    for q in queries:
+        scores = flat.vectors @ q
+        scores[~stage2_only] = -np.inf
+        top = np.argsort(-scores)[:args.k]
+        exact_stage2.append([flat.rows[i]["id"] for i in top])
+
+    print(
+        f"{len(queries)} queries, {len(flat)} chunks, {len(index.ruling_vectors)} rulings "
+        f"({index.rulings_manifest['with_abstract']} with abstract), {len(index.stage2_rows)} second-stage chunks"
+    )
+    print(f"exact flat search: {len(flat)} vectors scored, {flat_latency * 1000:.2f} ms/query\n")
+
+    print(f"{'rulings':>7} {'recall_all':>10} {'recall_stage2':>13} {'scored':>8} {'vs_flat':>7} {'ms/query':>8}")
+    for n in CANDIDATE_RULINGS:
+        index.candidate_rulings = n
+        start = time.perf_counter()
+        found = [{r["id"] for r in index.search(q, args.k, 2.0)} for q in queries]
+        latency = (time.perf_counter() - start) / len(queries)
+
+        # Vectors scored: every ruling vector, then the chunks of the shortlisted rulings
+        scored = []
+        for q in queries:
+            ruling_scores = index.ruling_vectors @ q
+            top = np.argsort(-ruling_scores)[:n]
+            scored.append(len(ruling_scores) + int(sum(index.offsets[r + 1] - index.offsets[r] for r in top)))
+
+        recall_all = np.mean([len(f & set(e)) / max(len(e), 1) for f, e in zip(found, exact_all)])
+        recall_stage2 = np.mean([len(f & set(e)) / max(len(e), 1) for f, e in zip(found, exact_stage2)])
+        print(
+            f"{n:>7} {recall_all:>10.3f} {recall_stage2:>13.3f} {np.mean(scored):>8.0f} "
+            f"{len(flat) / np.mean(scored):>6.1f}x {latency * 1000:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
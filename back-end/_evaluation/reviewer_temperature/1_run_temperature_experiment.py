@@ -1,5 +1,4 @@
 import json
-import time
 import httpx
 from datetime import datetime, timezone
 import subprocess
@@ -13,7 +12,7 @@ METRICS = ["cosine", "dot", "euclidean"]
 THRESHOLDS = [0.6, 0.7, 0.8, 0.9]
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
-__SCRIPT_VERSION__ = "temp_eval_v1.0.0"
+__SCRIPT_VERSION__ = "temp_eval_v1.1.0"
 
 def get_git_commit_hash():
     try:
@@ -83,35 +82,35 @@ for temp in TEMPERATURES:
             }
             refined_memos.append(refined_entry)
 
-            for metric in METRICS:
-                for threshold in THRESHOLDS:
-                    print(f"Evaluating {metric} @ {threshold}")
-                    eval_resp = client.post(
-                        f"{API_BASE}/evaluate-memo?similarity_metric={metric}&threshold={threshold}",
-                        json={"memo": memo_refined, "chunks": chunks}
-                    )
-                    eval_resp.raise_for_status()
-                    evaluation = eval_resp.json()
-
-                    log_entry = {
-                        "case_id": case_id,
-                        "created_at": original_created_at,
-                        "evaluated_at": datetime.now(timezone.utc).isoformat(),
-                        "temperature": temp,
-                        "model": MODEL_NAME,
-                        "memo_refined": memo_refined,
-                        "chunks": chunks,
-                        "evaluation": evaluation,
-                        "similarity_metric": metric,
-                        "threshold": threshold,
-                        "script_version": __SCRIPT_VERSION__,
-                        "git_commit": get_git_commit_hash()
-                    }
-                    with open(output_file, "a", encoding="utf-8") as fout:
-                        fout.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-
-                    results.append(log_entry)
-                    time.sleep(0.5)
+            # One request evaluates every metric x threshold configuration
+            print(f"Evaluating {len(METRICS)} metrics x {len(THRESHOLDS)} thresholds")
+            eval_resp = client.post(
+                f"{API_BASE}/evaluate-memo/sweep",
+                params={"similarity_metric": METRICS, "threshold": THRESHOLDS},
+                json={"memo": memo_refined, "chunks": chunks}
+            )
+            eval_resp.raise_for_status()
+            sweep = eval_resp.json()
+
+            for evaluation in sweep["evaluations"]:
+                log_entry = {
+                    "case_id": case_id,
+                    "created_at": original_created_at,
+                    "evaluated_at": datetime.now(timezone.utc).isoformat(),
+                    "temperature": temp,
+                    "model": MODEL_NAME,
+                    "memo_refined": memo_refined,
+                    "chunks": chunks,
+                    "evaluation": evaluation,
+                    "similarity_metric": evaluation["similarity_metric"],
+                    "threshold": evaluation["threshold"],
+                    "script_version": __SCRIPT_VERSION__,
+                    "git_commit": get_git_commit_hash()
+                }
+                with open(output_file, "a", encoding="utf-8") as fout:
+                    fout.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+
+                results.append(log_entry)
 
         except Exception as e:
             print(f"Error processing case {case_id} at T={temp}: {e}")
@@ -1,10 +1,9 @@
 import json
-import time
 import httpx
 from datetime import datetime
 import subprocess
 
-__SCRIPT_VERSION__ = "eval_refined_v1.0.0"
+__SCRIPT_VERSION__ = "eval_refined_v1.1.0"
 
 def get_git_commit_hash():
     try:
@@ -69,40 +68,40 @@ for entry in predefined_memos:
             print(f"No refined memo returned for {case_id}")
             continue
 
-        for metric in METRICS:
-            for threshold in THRESHOLDS:
-                print(f"Evaluating {metric} @ {threshold}")
-                eval_payload = {
-                    "memo": memo_refined,
-                    "chunks": chunks
-                }
-
-                eval_resp = client.post(
-                    f"{API_BASE}/evaluate-memo?similarity_metric={metric}&threshold={threshold}",
-                    json=eval_payload
-                )
-                eval_resp.raise_for_status()
-                evaluation = eval_resp.json()
-
-                log_entry = {
-                    "case_id": case_id,
-                    "original_created_at": original_created_at,
-                    "evaluated_at": datetime.utcnow().isoformat(),
-                    "memo_raw": memo_raw,
-                    "memo_refined": memo_refined,
-                    "chunks": chunks,
-                    "evaluation": evaluation,
-                    "similarity_metric": metric,
-                    "threshold": threshold,
-                    "script_version": __SCRIPT_VERSION__,
-                    "git_commit": get_git_commit_hash()
-                }
-
-                with open(OUTPUT_FILE, "a", encoding="utf-8") as fout:
-                    fout.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-
-                results.append(log_entry)
-                time.sleep(0.5)
+        # One request evaluates every metric x threshold configuration
+        print(f"Evaluating {len(METRICS)} metrics x {len(THRESHOLDS)} thresholds")
+        eval_payload = {
+            "memo": memo_refined,
+            "chunks": chunks
+        }
+
+        eval_resp = client.post(
+            f"{API_BASE}/evaluate-memo/sweep",
+            params={"similarity_metric": METRICS, "threshold": THRESHOLDS},
+            json=eval_payload
+        )
+        eval_resp.raise_for_status()
+        sweep = eval_resp.json()
+
+        for evaluation in sweep["evaluations"]:
+            log_entry = {
+                "case_id": case_id,
+                "original_created_at": original_created_at,
+                "evaluated_at": datetime.utcnow().isoformat(),
+                "memo_raw": memo_raw,
+                "memo_refined": memo_refined,
+                "chunks": chunks,
+                "evaluation": evaluation,
+                "similarity_metric": evaluation["similarity_metric"],
+                "threshold": evaluation["threshold"],
+                "script_version": __SCRIPT_VERSION__,
+                "git_commit": get_git_commit_hash()
+            }
+
+            with open(OUTPUT_FILE, "a", encoding="utf-8") as fout:
+                fout.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+
+            results.append(log_entry)
 
     except Exception as e:
         print(f"Failed for case {case_id}: {e}")
@@ -1,11 +1,10 @@
 import json
-import time
 import httpx
 from datetime import datetime
 import subprocess
 import os
 
-__SCRIPT_VERSION__ = "eval_v1.0.0"
+__SCRIPT_VERSION__ = "eval_v1.1.0"
 
 def get_git_commit_hash():
     try:
@@ -55,37 +54,37 @@ for case in cases:
             "chunks": chunks
         })
 
-        for metric in METRICS:
-            for threshold in THRESHOLDS:
-                print(f"Evaluating with {metric} @ threshold={threshold}")
-                eval_payload = {
-                    "memo": memo_text,
-                    "chunks": chunks
-                }
-                eval_resp = client.post(
-                    f"{API_BASE}/evaluate-memo?similarity_metric={metric}&threshold={threshold}",
-                    json=eval_payload
-                )
-                eval_resp.raise_for_status()
-                evaluation = eval_resp.json()
-
-                log_entry = {
-                    "case_id": case_id,
-                    "created_at": datetime.utcnow().isoformat(),
-                    "memo": memo_text,
-                    "chunks": chunks,
-                    "evaluation": evaluation,
-                    "similarity_metric": metric,
-                    "threshold": threshold,
-                    "script_version": __SCRIPT_VERSION__,
-                    "git_commit": get_git_commit_hash()
-                }
-
-                with open(EVAL_OUTPUT_FILE, "a", encoding="utf-8") as fout:
-                    fout.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-
-                results.append(log_entry)
-                time.sleep(0.5)
+        # One request evaluates every metric x threshold configuration
+        print(f"Evaluating {len(METRICS)} metrics x {len(THRESHOLDS)} thresholds")
+        eval_payload = {
+            "memo": memo_text,
+            "chunks": chunks
+        }
+        eval_resp = client.post(
+            f"{API_BASE}/evaluate-memo/sweep",
+            params={"similarity_metric": METRICS, "threshold": THRESHOLDS},
+            json=eval_payload
+        )
+        eval_resp.raise_for_status()
+        sweep = eval_resp.json()
+
+        for evaluation in sweep["evaluations"]:
+            log_entry = {
+                "case_id": case_id,
+                "created_at": datetime.utcnow().isoformat(),
+                "memo": memo_text,
+                "chunks": chunks,
+                "evaluation": evaluation,
+                "similarity_metric": evaluation["similarity_metric"],
+                "threshold": evaluation["threshold"],
+                "script_version": __SCRIPT_VERSION__,
+                "git_commit": get_git_commit_hash()
+            }
+
+            with open(EVAL_OUTPUT_FILE, "a", encoding="utf-8") as fout:
+                fout.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+
+            results.append(log_entry)
 
     except Exception as e:
         print(f"Failed for case {case_id}: {e}")
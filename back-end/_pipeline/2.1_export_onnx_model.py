@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.embedders import ONNX_MANIFEST_FILE, load_sentence_transformer
+
+# Exports multilingual-e5-large to ONNX with dynamic int8 quantization for CPU
+# embedding, then checks it against the fp32 model on a sample of our chunks:
+# cosine drift per chunk, overlap of the nearest neighbours within the sample,
+# and throughput. Use the export with EMBEDDING_ONNX_DIR (API local backend and
+# _pipeline/3_embed_json_chunks.py).
+CHUNKS_FILE = "../_data/chunks.jsonl"
+ONNX_MODEL_DIR = "../_data/onnx_e5"
+MODEL_NAME = "intfloat/multilingual-e5-large"
+NEIGHBOURS = 10
+
+parser = argparse.ArgumentParser(description="Export an int8-quantized ONNX copy of the embedding model")
+parser.add_argument(
+    "--quantization", choices=["arm64", "avx2", "avx512", "avx512_vnni"], default="avx512_vnni",
+    help="Target instruction set of the quantized kernels"
+)
+parser.add_argument("--sample", type=int, default=512, help="Chunks used for the parity check")
+parser.add_argument("--batch-size", type=int, default=32)
+args = parser.parse_args()
+
+
+def load_sample(path: str, size: int) -> list[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        texts = [f"passage: {json.loads(line)['text']}" for line in f]
+    # Evenly spaced, so every court and section of the corpus is represented
+    step = max(len(texts) // size, 1)
+    return texts[::step][:size]
+
+
+def encode(model, texts: list[str]) -> tuple[np.ndarray, float]:
+    model.encode(texts[:args.batch_size], batch_size=args.batch_size, normalize_embeddings=True)
+    start = time.perf_counter()
+    vectors = model.encode(texts, batch_size=args.batch_size, normalize_embeddings=True, convert_to_numpy=True)
+    return vectors.astype(np.float32), time.perf_counter() - start
+
+
+def neighbour_overlap(reference: np.ndarray, candidate: np.ndarray, k: int) -> float:
+    k = min(k, len(reference) - 1)
+    if k <= 0:
+        return 1.0
+    overlaps = []
+    for ref_scores, cand_scores in zip(reference @ reference.T, candidate @ candidate.T):
+        ref_top = set(np.argsort(-ref_scores)[1:k + 1])
+        cand_top = set(np.argsort(-cand_scores)[1:k + 1])
+        overlaps.append(len(ref_top & cand_top) / k)
+    return float(np.mean(overlaps))
+
+
+print(f"Exporting {MODEL_NAME} to ONNX in {ONNX_MODEL_DIR}...")
+onnx_model = SentenceTransformer(MODEL_NAME, backend="onnx", device="cpu")
+onnx_model.save(ONNX_MODEL_DIR)
+
+print(f"Quantizing to int8 ({args.quantization})...")
+export_dynamic_quantized_onnx_model(onnx_model, args.quantization, ONNX_MODEL_DIR)
+manifest = {
+    "model": MODEL_NAME,
+    "file_name": f"onnx/model_qint8_{args.quantization}.onnx",
+    "quantization": args.quantization,
+}
+with open(os.path.join(ONNX_MODEL_DIR, ONNX_MANIFEST_FILE), "w", encoding="utf-8") as f:
+    json.dump(manifest, f, indent=2)
+
+texts = load_sample(CHUNKS_FILE, args.sample)
+cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+print(f"Parity check on {len(texts)} chunks ({cores} cores)...")
+
+reference, reference_seconds = encode(SentenceTransformer(MODEL_NAME, device="cpu"), texts)
+results = {"torch_fp32": {"chunks_per_sec": len(texts) / reference_seconds}}
+candidates = {
+    "onnx_fp32": onnx_model,
+    "onnx_int8": load_sentence_transformer(MODEL_NAME, device="cpu", onnx_dir=ONNX_MODEL_DIR),
+}
+for name, model in candidates.items():
+    vectors, seconds = encode(model, texts)
+    drift = 1 - np.sum(reference * vectors, axis=1)
+    results[name] = {
+        "chunks_per_sec": len(texts) / seconds,
+        "mean_cosine_drift": float(drift.mean()),
+        "p99_cosine_drift": float(np.percentile(drift, 99)),
+        "max_cosine_drift": float(drift.max()),
+        f"neighbour_overlap@{NEIGHBOURS}": neighbour_overlap(reference, vectors, NEIGHBOURS),
+    }
+
+for result in results.values():
+    result["chunks_per_sec_per_core"] = result["chunks_per_sec"] / cores
+
+manifest["parity"] = {"sample": len(texts), "cores": cores, "batch_size": args.batch_size, **results}
+with open(os.path.join(ONNX_MODEL_DIR, ONNX_MANIFEST_FILE), "w", encoding="utf-8") as f:
+    json.dump(manifest, f, indent=2)
+
+print(f"\n{'model':<11} {'chunks/s':>9} {'per core':>9} {'mean drift':>11} {'max drift':>10} {'nn overlap':>11}")
+for name, result in results.items():
+    print(
+        f"{name:<11} {result['chunks_per_sec']:>9.1f} {result['chunks_per_sec_per_core']:>9.2f} "
+        f"{result.get('mean_cosine_drift', 0.0):>11.5f} {result.get('max_cosine_drift', 0.0):>10.5f} "
+        f"{result.get(f'neighbour_overlap@{NEIGHBOURS}', 1.0):>11.3f}"
+    )
+print(f"\nWrote {ONNX_MODEL_DIR}/{ONNX_MANIFEST_FILE}; set EMBEDDING_ONNX_DIR to use the int8 model")
@@ -1,79 +1,214 @@
 import os
-import json
+import sys
+import time
+import argparse
 import torch
 import numpy as np
-from uuid import uuid4
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 from supabase import create_client
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.vector_index import VectorIndexWriter, new_corpus_version
+from app.embedders import EncodingPool
+from app.ingest import fetch_stored_ids, fetch_stored_embeddings, delete_rows
+from app.ingest import load_previous_vectors, plan_ingestion
+from app.ingest import CHECKPOINT_FILE, Checkpoint, BatchUploader, file_fingerprint, iter_chunk_records, batched
+from app.env import get_embedding_onnx_dir
+
 load_dotenv()
 SUPABASE_URL = os.environ["SUPABASE_URL"]
 SUPABASE_SERVICE_ROLE = os.environ["SUPABASE_SERVICE_ROLE"]
 supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE)
 CHUNKS_FILE = "../_data/chunks.jsonl"
+VECTOR_INDEX_DIR = "../_data/vector_index"
+MODEL_NAME = "intfloat/multilingual-e5-large"
+
+# Concurrent upsert writers, rows per upsert request and retries per request
+# before the run stops at its checkpoint
+UPLOAD_WRITERS = 4
+UPLOAD_ROWS = 500
+UPLOAD_RETRIES = 5
+
+parser = argparse.ArgumentParser(description="Embed chunks.jsonl into Supabase and the local vector index")
+parser.add_argument("--processes", type=int, default=1, help="Encoding processes (CPU), each with its own model")
+parser.add_argument("--encode-batch", type=int, default=64, help="Texts per forward pass, grouped by token length")
+parser.add_argument(
+    "--stream-batch", type=int, default=None,
+    help="Rows read, encoded and checkpointed together (default: enough to keep every process busy)"
+)
+args = parser.parse_args()
+# Length bucketing only pays off when a streamed batch holds several forward
+# passes per process
+BATCH_SIZE = args.stream_batch or max(500, args.encode_batch * args.processes * 4)
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
-print("Using device:", device)
-model = SentenceTransformer("intfloat/multilingual-e5-large", device=device)
+# On CPU the int8 ONNX export (_pipeline/2.1_export_onnx_model.py) is much faster
+onnx_dir = get_embedding_onnx_dir() if device == "cpu" else None
+processes = args.processes if device == "cpu" else 1
+print("Using device:", device, f"(ONNX: {onnx_dir})" if onnx_dir else "", f"x {processes} processes")
+encoder = EncodingPool(MODEL_NAME, device=device, onnx_dir=onnx_dir, processes=processes, batch_size=args.encode_batch)
+dim = encoder.dim
+
+# Chunk ids are content hashes (ECLI, section, index, text, model), so a rerun
+# only embeds and uploads chunks that are new or changed and deletes the rest.
+# This first pass keeps only the ids; texts are streamed again below.
+fingerprint = file_fingerprint(CHUNKS_FILE)
+wanted = [key for key, _ in iter_chunk_records(CHUNKS_FILE, MODEL_NAME)]
 
-texts = []
-metas = []
-ecli_ids = []
+print("Diffing against stored chunks...")
+stored = fetch_stored_ids(supabase)
+previous_rows, previous_vectors = load_previous_vectors(VECTOR_INDEX_DIR, MODEL_NAME)
+plan = plan_ingestion(wanted, stored, set(previous_rows))
+print(
+    f"{len(wanted)} chunks: {plan['unchanged']} unchanged, {len(plan['upsert'])} to upload "
+    f"({len(plan['embed'])} to embed), {len(plan['delete'])} to delete"
+)
 
-with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
-    for line in f:
-        record = json.loads(line)
-        text = record["text"]
-        ecli = record.get("ecli", "")
-        meta = record.get("metadata", {})
+checkpoint = Checkpoint(os.path.join(VECTOR_INDEX_DIR, CHECKPOINT_FILE))
+resume = checkpoint.resumable(fingerprint, MODEL_NAME, BATCH_SIZE)
+if resume is None and not plan["upsert"] and not plan["delete"] and not plan["fetch"] \
+        and len(previous_rows) == len(wanted):
+    print("Nothing changed; corpus version kept")
+    sys.exit(0)
 
+# One version per ingestion run, shared by the local index and Supabase so the
+# API's retrieval and memo caches drop results computed against the old corpus
+corpus_version = resume["corpus_version"] if resume else new_corpus_version()
+start_batch = resume["batches"] if resume else 0
+if resume:
+    print(f"Resuming after batch {start_batch} ({resume['rows']} rows already committed)")
+
+# Only ids are kept for the whole run; texts and vectors live one batch at a time
+wanted_ids = set(wanted)
+to_upsert = set(plan["upsert"])
+to_fetch = set(plan["fetch"])
+to_delete = plan["delete"]
+del wanted, plan, stored
+
+
+def resolve_vectors(batch: list[tuple]) -> np.ndarray:
+    ids = [key for key, _ in batch]
+    vectors = np.empty((len(batch), dim), dtype=np.float32)
+    fetched = fetch_stored_embeddings(supabase, [key for key in ids if key in to_fetch])
+
+    missing = []
+    for n, key in enumerate(ids):
+        if key in previous_rows:
+            vectors[n] = previous_vectors[previous_rows[key]]
+        elif key in fetched:
+            vectors[n] = fetched[key]
+        else:
+            missing.append(n)
+    if missing:
         # Format input for E5 model
-        texts.append(f"passage: {text}")
-        ecli_ids.append(ecli)
-        metas.append(meta)
+        vectors[missing] = encoder.encode([f"passage: {batch[n][1]['text']}" for n in missing])
+    return vectors
+
+
+def to_row(key: str, record: dict) -> dict:
+    meta = {**record.get("metadata", {}), "ecli": record.get("ecli", "")}
+    return {
+        # Shared by the local vector index and Supabase
+        "id": key,
+        "ecli": meta["ecli"],
+        "content": record["text"],
+        "metadata": meta
+    }
 
-print(f"Encoding {len(texts)} chunks...")
 
-embeddings = model.encode(
-    texts,
-    batch_size=64,
-    show_progress_bar=True,
-    normalize_embeddings=True
+# Local index rows stream to partial files; upserts run on a few writers. The
+# checkpoint moves with the prefix of batches that are written and uploaded.
+writer = VectorIndexWriter(VECTOR_INDEX_DIR, dim, resume=resume)
+uploader = BatchUploader(
+    supabase, writers=UPLOAD_WRITERS, retries=UPLOAD_RETRIES, start=start_batch, request_rows=UPLOAD_ROWS
 )
+boundaries = {}
+started = time.perf_counter()
 
-print("Uploading to Supabase...")
-rows = []
-for emb, text, meta, ecli in zip(embeddings, texts, metas, ecli_ids):
-    meta["ecli"] = ecli
 
-    row = {
-        "ecli": ecli, 
-        "content": text.replace("passage: ", ""),
-        "metadata": meta, 
-        "embedding": emb.tolist()
-    }
-    rows.append(row)
+def save_checkpoint(committed: int):
+    if committed > start_batch and committed - 1 in boundaries:
+        checkpoint.save(
+            fingerprint=fingerprint,
+            model=MODEL_NAME,
+            corpus_version=corpus_version,
+            batch_size=BATCH_SIZE,
+            batches=committed,
+            **boundaries[committed - 1]
+        )
+        for batch_no in [b for b in boundaries if b < committed - 1]:
+            del boundaries[batch_no]
+
+
+try:
+    batches = batched(iter_chunk_records(CHUNKS_FILE, MODEL_NAME), BATCH_SIZE)
+    for batch_no, batch in enumerate(batches):
+        if batch_no < start_batch:
+            continue
 
-# Batch insert (up to 500 rows per call to avoid limits)
-batch_size = 500
-total_uploaded = 0
+        vectors = resolve_vectors(batch)
+        rows = [to_row(key, record) for key, record in batch]
+        writer.append(rows, vectors)
+        boundaries[batch_no] = writer.offsets()
 
-for i in range(0, len(rows), batch_size):
-    batch = rows[i:i+batch_size]
+        upload = [
+            {**row, "embedding": vector.tolist()}
+            for row, vector in zip(rows, vectors)
+            if row["id"] in to_upsert
+        ]
+        save_checkpoint(uploader.submit(batch_no, upload))
+        print(
+            f"Batch {batch_no + 1}: {writer.count} rows indexed, {uploader.uploaded} uploaded "
+            f"({writer.count / (time.perf_counter() - started):.0f} rows/s)"
+        )
+    save_checkpoint(uploader.drain())
+except Exception as e:
+    writer.close()
+    print(f"Stopped: {e}")
+    print(f"Rerun to resume from batch {uploader.committed}")
+    sys.exit(1)
+finally:
+    uploader.close()
+    encoder.close()
+
+# Memory-mapped copy for RETRIEVAL_BACKEND=local
+manifest = writer.finish(MODEL_NAME, corpus_version)
+checkpoint.clear()
+print(f"Wrote local vector index to {VECTOR_INDEX_DIR}")
+print(f"Upload complete. Total uploaded: {uploader.uploaded} chunks")
+encoding = encoder.stats()
+if encoding["texts"]:
+    print(
+        f"Encoded {encoding['texts']} chunks in {encoding['seconds']:.1f}s: {encoding['chunks_per_sec']:.1f} chunks/s "
+        f"({encoding['processes']} processes x {encoding['threads_per_process']} threads), padding efficiency "
+        f"{encoding['padding_efficiency']:.1%} vs {encoding['file_order_padding_efficiency']:.1%} in file order"
+    )
+
+# Deleted after the upload, so a ruling whose chunks changed is never missing
+if to_delete:
     try:
-        response = supabase.table("case_chunks").insert(batch).execute()
-        print(f"Uploaded batch {i//batch_size + 1}: {len(batch)} rows")
-        total_uploaded += len(batch)
+        print(f"Deleted {delete_rows(supabase, to_delete)} chunks no longer in {CHUNKS_FILE}")
     except Exception as e:
-        print(f"Error uploading batch {i//batch_size + 1}: {e}")
-        
-print(f"Upload complete. Total uploaded: {total_uploaded} chunks")
+        print(f"Error deleting stale chunks: {e}")
 
-# Verify count in database
+# Published after the upload, so caches only roll over once the new chunks are queryable
 try:
-    count_response = supabase.table("case_chunks").select("id", count="exact").execute()
-    db_count = count_response.count
-    print(f"Database now contains: {db_count} total chunks")
+    supabase.table("corpus_versions").insert({
+        "version": corpus_version,
+        "chunk_count": len(wanted_ids)
+    }).execute()
+    print(f"Corpus version is now {corpus_version}")
 except Exception as e:
-    print(f"Could not verify database count: {e}")
\ No newline at end of file
+    print(f"Could not bump corpus version (run _utils/supabase_corpus_versions.sql): {e}")
+
+# Reconciliation: chunks.jsonl, the local index and Supabase must hold the same ids
+stored_after = fetch_stored_ids(supabase)
+missing = len(wanted_ids - stored_after)
+unexpected = len(stored_after - wanted_ids)
+print(
+    f"Reconciliation: {len(wanted_ids)} chunks in {CHUNKS_FILE}, {manifest['count']} in the local index, "
+    f"{len(stored_after)} in Supabase ({missing} missing, {unexpected} unexpected)"
+)
+if missing or unexpected or manifest["count"] != len(wanted_ids):
+    print("Reconciliation failed; rerun to repair the difference")
+    sys.exit(1)
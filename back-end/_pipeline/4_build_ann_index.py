@@ -0,0 +1,27 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.ann_index import build_ann_index
+
+VECTOR_INDEX_DIR = "../_data/vector_index"
+# HNSW graph parameters: M = links per node, EF_CONSTRUCTION = build-time search breadth
+M = 32
+EF_CONSTRUCTION = 200
+
+parser = argparse.ArgumentParser(description="Build the HNSW index over the local vector index")
+parser.add_argument("--rebuild", action="store_true", help="Ignore the existing graph and build from scratch")
+args = parser.parse_args()
+
+print(f"Building HNSW index for {VECTOR_INDEX_DIR} (M={M}, ef_construction={EF_CONSTRUCTION})...")
+start = time.perf_counter()
+stats = build_ann_index(VECTOR_INDEX_DIR, m=M, ef_construction=EF_CONSTRUCTION, rebuild=args.rebuild)
+elapsed = time.perf_counter() - start
+
+mode = "incremental" if stats["incremental"] else "full"
+print(
+    f"{mode.capitalize()} build done in {elapsed:.1f}s: inserted {stats['inserted']} and deleted "
+    f"{stats['deleted']} of {stats['count']} chunks"
+)
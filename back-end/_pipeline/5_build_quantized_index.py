@@ -0,0 +1,24 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.quantized_index import build_quantized_index, QUANTIZATION_KINDS
+
+VECTOR_INDEX_DIR = "../_data/vector_index"
+
+parser = argparse.ArgumentParser(description="Build the quantized copy of the local vector index")
+parser.add_argument("--kind", choices=QUANTIZATION_KINDS, default="int8", help="int8 scalar codes or 1-bit sign codes")
+parser.add_argument("--dim", type=int, default=None, help="Reduce to this many PCA dimensions before quantizing")
+args = parser.parse_args()
+
+print(f"Building {args.kind} codes for {VECTOR_INDEX_DIR} (dims: {args.dim or 'all'})...")
+start = time.perf_counter()
+stats = build_quantized_index(VECTOR_INDEX_DIR, kind=args.kind, reduced_dim=args.dim)
+elapsed = time.perf_counter() - start
+
+print(
+    f"Done in {elapsed:.1f}s: {stats['count']} chunks, "
+    f"{stats['code_bytes'] / 2**20:.1f} MiB codes vs {stats['float32_bytes'] / 2**20:.1f} MiB float32"
+)
@@ -0,0 +1,23 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.sparse_index import build_sparse_index
+
+# Indexes the rows of the local vector index, i.e. ../_data/chunks.jsonl with the
+# chunk ids assigned by 3_embed_json_chunks.py, so BM25 and dense hits share ids
+VECTOR_INDEX_DIR = "../_data/vector_index"
+# BM25 parameters: K1 = term frequency saturation, B = document length normalization
+K1 = 1.2
+B = 0.75
+
+print(f"Building BM25 index for {VECTOR_INDEX_DIR} (k1={K1}, b={B})...")
+start = time.perf_counter()
+stats = build_sparse_index(VECTOR_INDEX_DIR, k1=K1, b=B)
+elapsed = time.perf_counter() - start
+
+print(
+    f"Done in {elapsed:.1f}s: {stats['count']} chunks, {stats['n_terms']} terms, "
+    f"{stats['n_postings']} postings ({stats['bytes'] / 2**20:.1f} MiB)"
+)
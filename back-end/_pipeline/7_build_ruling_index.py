@@ -0,0 +1,18 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.two_stage_index import build_two_stage_index, STAGE2_SECTIONS
+
+VECTOR_INDEX_DIR = "../_data/vector_index"
+
+print(f"Building ruling index for {VECTOR_INDEX_DIR} (second stage: {', '.join(STAGE2_SECTIONS)})...")
+start = time.perf_counter()
+stats = build_two_stage_index(VECTOR_INDEX_DIR)
+elapsed = time.perf_counter() - start
+
+print(
+    f"Done in {elapsed:.1f}s: {stats['count']} rulings ({stats['with_abstract']} with an abstract), "
+    f"{stats['n_rows']} second-stage chunks"
+)
@@ -0,0 +1,11 @@
+-- One row per ingestion run; the newest row is the current corpus version.
+-- Caches in the API (memo and retrieval results) are tagged with it and drop
+-- their entries when it changes.
+CREATE TABLE IF NOT EXISTS public.corpus_versions (
+  version TEXT PRIMARY KEY,
+  chunk_count INT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS corpus_versions_created_at_idx
+  ON public.corpus_versions (created_at DESC);
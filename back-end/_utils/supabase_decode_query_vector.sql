@@ -0,0 +1,85 @@
+-- Decodes a query vector sent as base64 little-endian float32 ('f32b64') or
+-- float16 ('f16b64') into a pgvector VECTOR (see app/vector_codec.py).
+-- Postgres has no bytea -> float4 cast, so each word is reassembled from its
+-- bytes and the IEEE 754 fields are evaluated (subnormals included; inf/NaN
+-- never occur in normalized embeddings).
+CREATE OR REPLACE FUNCTION decode_query_vector (
+  payload TEXT,
+  vector_encoding TEXT
+)
+RETURNS VECTOR
+LANGUAGE sql
+IMMUTABLE
+STRICT
+SET search_path = public, extensions, pg_catalog
+AS $$
+  WITH raw AS (
+    SELECT
+      decode(payload, 'base64') AS b,
+      CASE vector_encoding WHEN 'f16b64' THEN 2 ELSE 4 END AS width
+  ),
+  words AS (
+    SELECT
+      i,
+      width,
+      CASE width
+        WHEN 4 THEN
+          get_byte(b, i * 4)::BIGINT
+          | (get_byte(b, i * 4 + 1)::BIGINT << 8)
+          | (get_byte(b, i * 4 + 2)::BIGINT << 16)
+          | (get_byte(b, i * 4 + 3)::BIGINT << 24)
+        ELSE
+          get_byte(b, i * 2)::BIGINT
+          | (get_byte(b, i * 2 + 1)::BIGINT << 8)
+      END AS w
+    FROM raw, generate_series(0, length(b) / width - 1) AS i
+  ),
+  fields AS (
+    SELECT
+      i,
+      CASE width WHEN 4 THEN (w >> 31) & 1 ELSE (w >> 15) & 1 END AS sign,
+      CASE width WHEN 4 THEN (w >> 23) & 255 ELSE (w >> 10) & 31 END AS exponent,
+      CASE width WHEN 4 THEN w & 8388607 ELSE w & 1023 END AS mantissa,
+      CASE width WHEN 4 THEN 127 ELSE 15 END AS bias,
+      CASE width WHEN 4 THEN 23 ELSE 10 END AS mantissa_bits
+    FROM words
+  )
+  SELECT array_agg(
+    (1 - 2 * sign) * CASE
+      WHEN exponent = 0 THEN mantissa * power(2::FLOAT8, 1 - bias - mantissa_bits)
+      ELSE (1 + mantissa / power(2::FLOAT8, mantissa_bits)) * power(2::FLOAT8, exponent - bias)
+    END
+    ORDER BY i
+  )::FLOAT4[]::VECTOR
+  FROM fields;
+$$;
+
+-- match_case_chunks_v2 for a packed query vector; decode_query_vector runs once.
+CREATE OR REPLACE FUNCTION match_case_chunks_packed (
+  query_vector TEXT,
+  vector_encoding TEXT,
+  match_threshold FLOAT,
+  match_count INT,
+  top_k INT,
+  max_per_ecli INT
+)
+RETURNS TABLE (
+  id UUID,
+  ecli TEXT,
+  content TEXT,
+  metadata JSONB,
+  similarity FLOAT
+)
+LANGUAGE sql
+STABLE
+SET search_path = public, extensions, pg_catalog
+AS $$
+  SELECT *
+  FROM match_case_chunks_v2(
+    decode_query_vector(query_vector, vector_encoding),
+    match_threshold,
+    match_count,
+    top_k,
+    max_per_ecli
+  );
+$$;
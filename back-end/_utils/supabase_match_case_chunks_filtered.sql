@@ -0,0 +1,125 @@
+-- Metadata-filtered retrieval. Filters are optional (NULL = no filter); several
+-- values for one field are OR-ed, different fields AND-ed, values compare
+-- case-insensitively and dates are inclusive "YYYY-MM-DD" bounds.
+
+-- Expression indexes so selective filters are resolved before the vector scan:
+-- the planner can take the matching rows from these indexes and rank only them.
+CREATE INDEX IF NOT EXISTS case_chunks_court_idx ON public.case_chunks (lower(metadata->>'court'));
+CREATE INDEX IF NOT EXISTS case_chunks_section_idx ON public.case_chunks (lower(metadata->>'section'));
+CREATE INDEX IF NOT EXISTS case_chunks_procedure_idx ON public.case_chunks (lower(metadata->>'procedure'));
+CREATE INDEX IF NOT EXISTS case_chunks_subject_idx ON public.case_chunks (lower(metadata->>'subject'));
+CREATE INDEX IF NOT EXISTS case_chunks_date_idx ON public.case_chunks ((metadata->>'date'));
+
+-- Same result shape and per-ECLI cap as match_case_chunks_v2. With an HNSW index
+-- and broad filters, pgvector >= 0.8 should run with
+--   ALTER DATABASE postgres SET hnsw.iterative_scan = relaxed_order;
+-- so the index scan keeps going until match_count rows pass the filters.
+CREATE OR REPLACE FUNCTION match_case_chunks_filtered (
+  query_embedding VECTOR,
+  match_threshold FLOAT,
+  match_count INT,
+  top_k INT,
+  max_per_ecli INT,
+  filter_courts TEXT[] DEFAULT NULL,
+  filter_sections TEXT[] DEFAULT NULL,
+  filter_procedures TEXT[] DEFAULT NULL,
+  filter_subjects TEXT[] DEFAULT NULL,
+  filter_date_from TEXT DEFAULT NULL,
+  filter_date_to TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  ecli TEXT,
+  content TEXT,
+  metadata JSONB,
+  similarity FLOAT
+)
+LANGUAGE sql
+STABLE
+SET search_path = public, extensions, pg_catalog
+AS $$
+  WITH candidates AS (
+    SELECT
+      c.id,
+      COALESCE(
+        NULLIF(c.ecli, ''),
+        NULLIF(c.metadata->>'ecli', ''),
+        NULLIF(split_part(c.metadata->>'title', ' ', 1), ''),
+        'UNKNOWN'
+      ) AS ecli,
+      c.content,
+      c.metadata,
+      c.embedding <=> query_embedding AS distance
+    FROM public.case_chunks c
+    WHERE (filter_courts IS NULL OR lower(c.metadata->>'court') = ANY (filter_courts))
+      AND (filter_sections IS NULL OR lower(c.metadata->>'section') = ANY (filter_sections))
+      AND (filter_procedures IS NULL OR lower(c.metadata->>'procedure') = ANY (filter_procedures))
+      AND (filter_subjects IS NULL OR lower(c.metadata->>'subject') = ANY (filter_subjects))
+      AND (filter_date_from IS NULL OR c.metadata->>'date' >= filter_date_from)
+      AND (filter_date_to IS NULL OR left(c.metadata->>'date', 10) <= filter_date_to)
+    ORDER BY c.embedding <=> query_embedding
+    LIMIT match_count
+  ),
+  ranked AS (
+    SELECT
+      candidates.*,
+      row_number() OVER (PARTITION BY candidates.ecli ORDER BY candidates.distance) AS ecli_rank
+    FROM candidates
+    WHERE candidates.distance < match_threshold
+  )
+  SELECT
+    ranked.id,
+    ranked.ecli,
+    ranked.content,
+    ranked.metadata,
+    1 - ranked.distance AS similarity
+  FROM ranked
+  WHERE ranked.ecli_rank <= max_per_ecli
+  ORDER BY ranked.distance
+  LIMIT top_k;
+$$;
+
+-- The packed-vector RPC gains the same optional filters. The old signature is
+-- dropped first so PostgREST does not see two overloads.
+DROP FUNCTION IF EXISTS match_case_chunks_packed (TEXT, TEXT, FLOAT, INT, INT, INT);
+
+CREATE OR REPLACE FUNCTION match_case_chunks_packed (
+  query_vector TEXT,
+  vector_encoding TEXT,
+  match_threshold FLOAT,
+  match_count INT,
+  top_k INT,
+  max_per_ecli INT,
+  filter_courts TEXT[] DEFAULT NULL,
+  filter_sections TEXT[] DEFAULT NULL,
+  filter_procedures TEXT[] DEFAULT NULL,
+  filter_subjects TEXT[] DEFAULT NULL,
+  filter_date_from TEXT DEFAULT NULL,
+  filter_date_to TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  ecli TEXT,
+  content TEXT,
+  metadata JSONB,
+  similarity FLOAT
+)
+LANGUAGE sql
+STABLE
+SET search_path = public, extensions, pg_catalog
+AS $$
+  SELECT *
+  FROM match_case_chunks_filtered(
+    decode_query_vector(query_vector, vector_encoding),
+    match_threshold,
+    match_count,
+    top_k,
+    max_per_ecli,
+    filter_courts,
+    filter_sections,
+    filter_procedures,
+    filter_subjects,
+    filter_date_from,
+    filter_date_to
+  );
+$$;
@@ -0,0 +1,56 @@
+-- Like match_case_chunks, but applies the per-ECLI cap in SQL and returns only the
+-- final top_k rows (with their ECLI) instead of match_count candidates.
+-- The distance is computed once per candidate; the threshold is applied after
+-- the nearest-neighbour LIMIT so the ORDER BY can still use the vector index.
+CREATE OR REPLACE FUNCTION match_case_chunks_v2 (
+  query_embedding VECTOR,
+  match_threshold FLOAT,
+  match_count INT,
+  top_k INT,
+  max_per_ecli INT
+)
+RETURNS TABLE (
+  id UUID,
+  ecli TEXT,
+  content TEXT,
+  metadata JSONB,
+  similarity FLOAT
+)
+LANGUAGE sql
+STABLE
+SET search_path = public, extensions, pg_catalog
+AS $$
+  WITH candidates AS (
+    SELECT
+      c.id,
+      COALESCE(
+        NULLIF(c.ecli, ''),
+        NULLIF(c.metadata->>'ecli', ''),
+        NULLIF(split_part(c.metadata->>'title', ' ', 1), ''),
+        'UNKNOWN'
+      ) AS ecli,
+      c.content,
+      c.metadata,
+      c.embedding <=> query_embedding AS distance
+    FROM public.case_chunks c
+    ORDER BY c.embedding <=> query_embedding
+    LIMIT match_count
+  ),
+  ranked AS (
+    SELECT
+      candidates.*,
+      row_number() OVER (PARTITION BY candidates.ecli ORDER BY candidates.distance) AS ecli_rank
+    FROM candidates
+    WHERE candidates.distance < match_threshold
+  )
+  SELECT
+    ranked.id,
+    ranked.ecli,
+    ranked.content,
+    ranked.metadata,
+    1 - ranked.distance AS similarity
+  FROM ranked
+  WHERE ranked.ecli_rank <= max_per_ecli
+  ORDER BY ranked.distance
+  LIMIT top_k;
+$$;
@@ -0,0 +1,158 @@
+import json
+import os
+import hnswlib
+import numpy as np
+from app.vector_index import LocalVectorIndex
+
+# HNSW graph persisted next to the flat vector index it was built from.
+# Labels in the graph are stable per chunk id and listed in hnsw_labels.txt (one
+# id per label, an empty line for a deleted label), so they survive ingestion
+# runs that rewrite the flat index in another row order.
+ANN_FILE = "hnsw.bin"
+ANN_MANIFEST_FILE = "hnsw.json"
+ANN_LABELS_FILE = "hnsw_labels.txt"
+# Filters matching at most this many rows are answered by an exact scan of just
+# those rows, which beats walking the graph with a per-node filter callback
+EXACT_FILTER_ROWS = 20000
+# An incremental build rebuilds from scratch once deleted labels would make up
+# more than this share of the graph
+MAX_DELETED_SHARE = 0.3
+
+
+def _read_ann_manifest(index_dir: str) -> dict | None:
+    paths = [os.path.join(index_dir, name) for name in (ANN_MANIFEST_FILE, ANN_FILE, ANN_LABELS_FILE)]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    with open(paths[0], "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Chunk id per label; None for deleted labels
+def _read_labels(index_dir: str) -> list[str | None]:
+    with open(os.path.join(index_dir, ANN_LABELS_FILE), "r", encoding="utf-8") as f:
+        return [line.rstrip("\n") or None for line in f]
+
+
+def _write_labels(index_dir: str, labels: list[str | None]):
+    with open(os.path.join(index_dir, ANN_LABELS_FILE), "w", encoding="utf-8") as f:
+        f.writelines((chunk_id or "") + "\n" for chunk_id in labels)
+
+
+# Builds (or incrementally updates) the HNSW graph for the flat index in `index_dir`.
+# Chunks new since the previous build are inserted under fresh labels and chunks
+# that left the flat index are marked deleted, wherever they sit in its row
+# order. Chunk ids are content hashes, so a kept id still has the same vector.
+# Falls back to a full build when the graph does not fit (other dimension, too
+# many deleted labels) or `rebuild` is set.
+def build_ann_index(index_dir: str, m: int = 32, ef_construction: int = 200, rebuild: bool = False) -> dict:
+    flat = LocalVectorIndex(index_dir)
+    count, dim = len(flat), flat.vectors.shape[1]
+    ann = hnswlib.Index(space="cosine", dim=dim)
+
+    manifest = None if rebuild else _read_ann_manifest(index_dir)
+    labels = _read_labels(index_dir) if manifest and manifest["dim"] == dim else None
+    if labels is not None:
+        live = {chunk_id: label for label, chunk_id in enumerate(labels) if chunk_id is not None}
+        removed = [label for chunk_id, label in live.items() if chunk_id not in flat.id_to_row]
+        added = [chunk_id for chunk_id in flat.id_to_row if chunk_id not in live]
+        deleted = len(labels) - len(live) + len(removed)
+        if deleted > MAX_DELETED_SHARE * (len(labels) + len(added)):
+            labels = None
+
+    if labels is None:
+        ann.init_index(max_elements=max(count, 1), M=m, ef_construction=ef_construction)
+        labels, removed, added = [], [], list(flat.id_to_row)
+        incremental = False
+    else:
+        ann.load_index(os.path.join(index_dir, ANN_FILE), max_elements=max(len(labels) + len(added), 1))
+        m, ef_construction = manifest["m"], manifest["ef_construction"]
+        incremental = True
+
+    for label in removed:
+        ann.mark_deleted(label)
+        labels[label] = None
+    if added:
+        new_labels = np.arange(len(labels), len(labels) + len(added))
+        rows = np.array([flat.id_to_row[chunk_id] for chunk_id in added])
+        ann.add_items(np.asarray(flat.vectors[rows]), new_labels)
+        labels.extend(added)
+
+    # Graph and labels first, manifest last
+    ann.save_index(os.path.join(index_dir, ANN_FILE))
+    _write_labels(index_dir, labels)
+    with open(os.path.join(index_dir, ANN_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "count": count,
+            "labels": len(labels),
+            "dim": dim,
+            "m": m,
+            "ef_construction": ef_construction,
+        }, f, indent=2)
+
+    return {"count": count, "inserted": len(added), "deleted": len(removed), "incremental": incremental}
+
+
+class AnnVectorIndex:
+    def __init__(self, index_dir: str, ef_search: int = 64):
+        self.flat = LocalVectorIndex(index_dir)
+        self.manifest = self.flat.manifest
+        self.rows = self.flat.rows
+        manifest = _read_ann_manifest(index_dir)
+        if manifest is None:
+            raise RuntimeError(f"No HNSW index in {index_dir}; run _pipeline/4_build_ann_index.py")
+
+        # Flat row of every label (-1 for deleted ones); the graph must cover
+        # exactly the chunks of the flat index
+        labels = _read_labels(index_dir)
+        self.label_rows = np.array(
+            [-1 if chunk_id is None else self.flat.id_to_row.get(chunk_id, -1) for chunk_id in labels], dtype=np.int64
+        )
+        live = sum(chunk_id is not None for chunk_id in labels)
+        if live != len(self.flat) or int((self.label_rows >= 0).sum()) != live:
+            raise RuntimeError(f"HNSW index in {index_dir} is stale; update it with _pipeline/4_build_ann_index.py")
+
+        self.ann = hnswlib.Index(space="cosine", dim=manifest["dim"])
+        self.ann.load_index(os.path.join(index_dir, ANN_FILE), max_elements=max(len(labels), 1))
+        self.ef_search = ef_search
+        self.ann.set_ef(ef_search)
+
+    def __len__(self):
+        return len(self.flat)
+
+    def get_vectors(self, ids: list[str]) -> list[np.ndarray | None]:
+        return self.flat.get_vectors(ids)
+
+    # Same contract as LocalVectorIndex.search; higher `ef_search` trades latency for recall.
+    def search(self, vector: np.ndarray, match_count: int = 50, match_threshold: float = 0.7,
+               filters: dict | None = None) -> list[dict]:
+        mask = self.flat.metadata.mask(filters) if filters else None
+        allowed = len(self.flat) if mask is None else int(mask.sum())
+        if mask is not None and allowed <= EXACT_FILTER_ROWS:
+            return self.flat.search(vector, match_count, match_threshold, filters)
+
+        k = min(match_count, allowed)
+        if k == 0:
+            return []
+        if k > self.ef_search:
+            self.ef_search = k
+            self.ann.set_ef(k)
+
+        query = np.asarray(vector, dtype=np.float32)
+        if mask is None:
+            labels, distances = self.ann.knn_query(query, k=k)
+        else:
+            labels, distances = self.ann.knn_query(query, k=k, filter=lambda label: bool(mask[self.label_rows[label]]))
+
+        results = []
+        for label, dist in zip(labels[0], distances[0]):
+            if dist >= match_threshold:
+                break
+            row = self.flat.rows[self.label_rows[label]]
+            results.append({
+                "id": row["id"],
+                "ecli": row["ecli"],
+                "content": row["content"],
+                "metadata": row["metadata"],
+                "similarity": float(1 - dist),
+            })
+        return results
@@ -0,0 +1,362 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+# Thread-safe bounded LRU map with hit/miss/eviction counters.
+class LRUCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# SQLite-backed float32 vector store that survives restarts. Least recently used
+# rows are deleted once the table grows past `max_entries`. Reads never write:
+# recency updates are buffered and written in one transaction every
+# `touch_batch` hits or on the next put (before any eviction), so a hit costs
+# no write lock or fsync. Buffered updates lost on exit only age those rows.
+class DiskVectorCache:
+    def __init__(self, path: str, max_entries: int, touch_batch: int = 256):
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self._touched = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Shared by the threadpool; all access goes through self._lock
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors (last_used)")
+        self._conn.commit()
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM vectors WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touched()
+                self._conn.commit()
+            return np.frombuffer(row[0], dtype="<f4").copy()
+
+    # Writes buffered recency updates; caller holds the lock and commits
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE vectors SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def put(self, key: str, vector: np.ndarray):
+        blob = np.ascontiguousarray(vector, dtype="<f4").tobytes()
+        with self._lock:
+            self._touched.pop(key, None)
+            self._flush_touched()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO vectors (key, vector, last_used) VALUES (?, ?, ?)",
+                (key, blob, time.time())
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()
+            if count > self.max_entries:
+                excess = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM vectors WHERE key IN (SELECT key FROM vectors ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Two-level cache for embeddings: in-memory LRU in front of an optional disk tier.
+# Disk hits are promoted into memory.
+class EmbeddingCache:
+    def __init__(self, max_entries: int, disk_path: str | None = None, max_disk_entries: int = 100_000):
+        self.memory = LRUCache(max_entries)
+        self.disk = DiskVectorCache(disk_path, max_disk_entries) if disk_path else None
+
+    # Keyed on whitespace-normalized text plus everything else that changes the vector
+    @staticmethod
+    def make_key(text: str, model: str, prefix: str) -> str:
+        return hashlib.sha256(f"{model}\x00{prefix}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> np.ndarray | None:
+        vector = self.memory.get(key)
+        if vector is not None or self.disk is None:
+            return vector
+        vector = self.disk.get(key)
+        if vector is not None:
+            self.memory.put(key, vector)
+        return vector
+
+    def put(self, key: str, vector: np.ndarray):
+        self.memory.put(key, vector)
+        if self.disk is not None:
+            self.disk.put(key, vector)
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+# Collapses runs of whitespace so trivially different inputs share a cache entry
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+# Cache of generated memos. Lookups are either exact (same normalized query
+# text) or near (query embedding similarity >= `similarity_threshold` and the
+# exact same set of retrieved chunks). Entries expire after `ttl_seconds`, the
+# least recently used entry is evicted past `max_entries`, and everything is
+# dropped when the corpus version changes.
+class MemoCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.corpus_version = None
+        self._entries = OrderedDict()
+        self._by_chunk_set = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # Filters change which chunks a memo may cite, so they are part of the key
+    @staticmethod
+    def make_key(query: str, filters: dict | None = None) -> str:
+        key = normalize_text(query)
+        if filters:
+            key += "\x00" + json.dumps(filters, sort_keys=True)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def chunk_set(chunks: list[dict]) -> frozenset:
+        return frozenset(c.get("id") for c in chunks)
+
+    # Callers hold self._lock
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        keys = self._by_chunk_set.get(entry["chunk_set"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_chunk_set[entry["chunk_set"]]
+
+    def _check_version(self, corpus_version: str):
+        if corpus_version != self.corpus_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_chunk_set.clear()
+            self.corpus_version = corpus_version
+
+    def _is_expired(self, entry: dict) -> bool:
+        return time.monotonic() - entry["created_at"] > self.ttl_seconds
+
+    def get_exact(self, key: str, corpus_version: str) -> dict | None:
+        with self._lock:
+            self._check_version(corpus_version)
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry
+
+    # Counts a miss when nothing matches, so call it after get_exact missed
+    def get_similar(self, vector: np.ndarray, chunks: list[dict], corpus_version: str) -> dict | None:
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        with self._lock:
+            self._check_version(corpus_version)
+            best_key, best_score = None, self.similarity_threshold
+            for key in list(self._by_chunk_set.get(self.chunk_set(chunks), ())):
+                entry = self._entries[key]
+                if self._is_expired(entry):
+                    self._remove(key)
+                    self.expirations += 1
+                    continue
+                score = float(entry["vector"] @ query)
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.near_hits += 1
+            return self._entries[best_key]
+
+    def put(self, key: str, vector: np.ndarray, chunks: list[dict], memo: str, corpus_version: str):
+        if self.max_entries <= 0:
+            return
+        vector = np.asarray(vector, dtype=np.float32)
+        entry = {
+            "vector": vector / (np.linalg.norm(vector) or 1.0),
+            "chunk_set": self.chunk_set(chunks),
+            "chunks": chunks,
+            "memo": memo,
+            "created_at": time.monotonic(),
+        }
+        with self._lock:
+            self._check_version(corpus_version)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._by_chunk_set.setdefault(entry["chunk_set"], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "corpus_version": self.corpus_version,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_rate": (self.exact_hits + self.near_hits) / lookups if lookups else 0.0,
+        }
+
+
+# Retrieval results keyed by the query vector and retrieval parameters, tagged with
+# the corpus version they were computed against. A version change drops every
+# entry. Each entry remembers how long the retrieval took, so hits can report
+# the latency they saved.
+class RetrievalCache:
+    def __init__(self, max_entries: int):
+        self.results = LRUCache(max_entries)
+        self.corpus_version = None
+        self._lock = threading.Lock()
+        self.invalidations = 0
+        self.seconds_saved = 0.0
+
+    @staticmethod
+    def make_key(vector: np.ndarray, top_k: int, max_per_ecli: int, match_threshold: float,
+                 query_text: str | None = None, filters: dict | None = None) -> str:
+        h = hashlib.sha256(np.ascontiguousarray(vector, dtype="<f4").tobytes())
+        h.update(f"\x00{top_k}\x00{max_per_ecli}\x00{match_threshold}".encode("utf-8"))
+        if query_text is not None:
+            h.update(f"\x00{normalize_text(query_text)}".encode("utf-8"))
+        if filters:
+            h.update(f"\x00{json.dumps(filters, sort_keys=True)}".encode("utf-8"))
+        return h.hexdigest()
+
+    def _check_version(self, corpus_version: str):
+        with self._lock:
+            if corpus_version != self.corpus_version:
+                if len(self.results):
+                    self.invalidations += 1
+                self.results.clear()
+                self.corpus_version = corpus_version
+
+    def get(self, key: str, corpus_version: str) -> list[dict] | None:
+        self._check_version(corpus_version)
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+        chunks, seconds = entry
+        with self._lock:
+            self.seconds_saved += seconds
+        return list(chunks)
+
+    def put(self, key: str, chunks: list[dict], seconds: float, corpus_version: str):
+        self._check_version(corpus_version)
+        self.results.put(key, (list(chunks), seconds))
+
+    def stats(self) -> dict:
+        return {
+            **self.results.stats(),
+            "corpus_version": self.corpus_version,
+            "invalidations": self.invalidations,
+            "latency_saved_ms": 1000 * self.seconds_saved,
+            "avg_latency_saved_ms": 1000 * self.seconds_saved / self.results.hits if self.results.hits else 0.0,
+        }
@@ -0,0 +1,316 @@
+import json
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+MIN_TOKENS = 50    # minimum tokens per chunk
+MAX_TOKENS = 512   # maximum tokens per chunk
+TOKENIZER_NAME = "intfloat/multilingual-e5-large"
+SENTENCE_SPLIT_REGEX = re.compile(r'(?<=[\.\!\?])\s+')
+
+
+def split_into_sentences(text):
+    return SENTENCE_SPLIT_REGEX.split(text)
+
+
+# Token-bounded chunking of ruling sections (used by _pipeline/1_chunk_json_data.py).
+#
+# The e5 / XLM-R tokenizer splits on whitespace before applying SentencePiece, so
+# the token count of "a b" is count(a) + count(b). Every text is therefore
+# tokenized once (paragraphs and sentences in batches through the fast
+# tokenizer) and the size of a growing chunk is a running sum, instead of
+# re-tokenizing the whole chunk after each added sentence. Chunk boundaries are
+# the same as with re-tokenizing; tests/test_chunking.py pins this.
+class Chunker:
+    def __init__(self, tokenizer, min_tokens: int = MIN_TOKENS, max_tokens: int = MAX_TOKENS):
+        self.tokenizer = tokenizer
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self._counts = {}
+
+    # Drops cached counts; call between documents to keep memory flat
+    def reset(self):
+        self._counts.clear()
+
+    # Token counts of `texts`, tokenizing the uncached ones in one batch
+    def counts(self, texts: list[str]) -> list[int]:
+        missing = list({text for text in texts if text not in self._counts})
+        if missing:
+            encoded = self.tokenizer(missing, add_special_tokens=False, return_attention_mask=False)
+            for text, ids in zip(missing, encoded["input_ids"]):
+                self._counts[text] = len(ids)
+        return [self._counts[text] for text in texts]
+
+    def count(self, text: str) -> int:
+        return self.counts([text])[0]
+
+    def truncate(self, text: str, max_tokens: int | None = None) -> str:
+        max_tokens = max_tokens or self.max_tokens
+        if self.count(text) <= max_tokens:
+            return text
+        tokens = self.tokenizer.tokenize(text)
+        return self.tokenizer.convert_tokens_to_string(tokens[:max_tokens])
+
+    def _stripped_count(self, text: str, count: int) -> int:
+        stripped = text.strip()
+        return count if stripped == text else self.count(stripped)
+
+    # Packs consecutive sentences into chunks of min_tokens..max_tokens tokens
+    def chunk_sentences(self, sentences: list[str]) -> list[str]:
+        sentence_counts = self.counts(sentences)
+        chunks = []
+        # Token count per chunk; None until needed (after truncation)
+        chunk_counts = []
+        # Current chunk as its sentences; joined with spaces only when emitted
+        current = []
+        current_count = 0
+        has_text = False
+
+        for sentence, count in zip(sentences, sentence_counts):
+            # Test adding this sentence
+            test_count = current_count + count if has_text else count
+
+            if test_count <= self.max_tokens:
+                if has_text:
+                    current.append(sentence)
+                else:
+                    current = [sentence]
+                current_count = test_count
+                has_text = bool(sentence) or has_text
+            elif current:
+                current_text = " ".join(current) if has_text else ""
+                if current_count >= self.min_tokens:
+                    chunks.append(current_text.strip())
+                    chunk_counts.append(self._stripped_count(current_text, current_count))
+                    current = [sentence]
+                    current_count = count
+                    has_text = bool(sentence)
+                else:
+                    # Current chunk too small: add the sentence anyway and truncate
+                    test_text = current_text + (" " if current_text else "") + sentence
+                    chunks.append(self.truncate(test_text).strip())
+                    chunk_counts.append(None)
+                    current = []
+                    current_count = 0
+                    has_text = False
+            else:
+                # No current chunk, but the single sentence is too long
+                truncated = self.truncate(sentence)
+                if self.count(truncated) >= self.min_tokens:
+                    chunks.append(truncated.strip())
+                    chunk_counts.append(None)
+
+        # Handle remaining sentences
+        if current and has_text:
+            current_text = " ".join(current)
+            if current_count >= self.min_tokens:
+                chunks.append(current_text.strip())
+            elif chunks:
+                # Merge with the previous chunk if it stays within max_tokens
+                last_count = chunk_counts[-1] if chunk_counts[-1] is not None else self.count(chunks[-1])
+                if last_count + current_count <= self.max_tokens:
+                    chunks[-1] = chunks[-1] + " " + current_text
+
+        return chunks
+
+    def _split(self, text: str, count: int, sentences: list[str] | None = None) -> list[str]:
+        if count <= self.max_tokens:
+            return [text]
+        return self.chunk_sentences(sentences or split_into_sentences(text))
+
+    # Merges paragraphs shorter than min_tokens and splits those over max_tokens.
+    # Sentences are split on whitespace, so a paragraph's count is the sum of its
+    # sentences' counts and each sentence is tokenized once, in one batch.
+    def chunk_paragraphs(self, paragraphs: list[str]) -> list[str]:
+        para_sentences = [split_into_sentences(para) for para in paragraphs]
+        self.counts([sentence for sentences in para_sentences for sentence in sentences])
+        all_chunks = []
+        accumulator = []
+        acc_count = 0
+
+        for para, sentences in zip(paragraphs, para_sentences):
+            para_count = sum(self.counts(sentences))
+            if para_count >= self.min_tokens:
+                # Process any accumulated small paragraphs first
+                if accumulator and acc_count >= self.min_tokens:
+                    all_chunks.extend(self._split(" ".join(accumulator), acc_count))
+                accumulator = []
+                acc_count = 0
+
+                all_chunks.extend(self._split(para, para_count, sentences))
+            else:
+                accumulator.append(para)
+                acc_count += para_count
+                if acc_count >= self.min_tokens:
+                    all_chunks.extend(self._split(" ".join(accumulator), acc_count))
+                    accumulator = []
+                    acc_count = 0
+
+        # Leftover accumulated paragraphs below min_tokens are dropped
+        if accumulator and acc_count >= self.min_tokens:
+            all_chunks.extend(self._split(" ".join(accumulator), acc_count))
+
+        return all_chunks
+
+
+def get_quarter_from_date(date_str):
+    try:
+        month = int(date_str.split("-")[1])
+        return (month - 1) // 3 + 1
+    except Exception:
+        return None
+
+
+# Chunk records for one ruling from rechtspraak-json: the abstract as its own
+# chunk (section ABSTRACT, chunk_index -1) followed by every section's chunks.
+# Returns (records, abstracts skipped as too small, abstracts truncated).
+def chunk_ruling(data: dict, chunker: Chunker) -> tuple[list[dict], int, int]:
+    chunker.reset()
+    records = []
+    skipped_small = 0
+    truncated_large = 0
+
+    # Pull relevant metadata fields from data['metadata']
+    meta = data.get("metadata", {})
+    ecli = meta.get("_id", "")
+
+    # title may be a dict with '@value' or a plain string
+    raw_title = meta.get("title", "")
+    title = raw_title.get("@value", "") if isinstance(raw_title, dict) else raw_title
+
+    # abstract may be dict with '@value'
+    raw_abs = meta.get("abstract", {})
+    abstract = raw_abs.get("@value", "") if isinstance(raw_abs, dict) else raw_abs or ""
+    # procedure may be list or string
+    proc = meta.get("procedure", [])
+    procedure = proc[0] if isinstance(proc, list) and proc else (proc if isinstance(proc, str) else "")
+    # judgement date
+    judgment_date = meta.get("date", meta.get("issued", ""))
+    quarter = get_quarter_from_date(judgment_date)
+    # subject may be list or string
+    subj = meta.get("subject", [])
+    subject = subj[0] if isinstance(subj, list) and subj else (subj if isinstance(subj, str) else "")
+    # court from creator.rdfs:label[0].@value
+    creator = meta.get("creator", {})
+    if isinstance(creator, dict):
+        labels = creator.get("rdfs:label", [])
+        court = labels[0].get("@value", "") if isinstance(labels, list) and labels else ""
+    else:
+        court = ""
+
+    def record(text: str, section: str, index: int) -> dict:
+        return {
+            "ecli": ecli,
+            "text": text,
+            "metadata": {
+                "title": title,
+                "procedure": procedure,
+                "subject": subject,
+                "court": court,
+                "date": judgment_date,
+                "quarter": quarter,
+                "section": section,
+                "chunk_index": index,
+                "sub_chunk_index": 0
+            }
+        }
+
+    # Abstract as its own chunk if it meets token requirements
+    if abstract and abstract.strip():
+        abstract_tokens = chunker.count(abstract.strip())
+        if abstract_tokens >= chunker.min_tokens:
+            if abstract_tokens <= chunker.max_tokens:
+                abs_text = abstract.strip()
+            else:
+                abs_text = chunker.truncate(abstract.strip())
+                truncated_large += 1
+            records.append(record(abs_text, "ABSTRACT", -1))
+        else:
+            skipped_small += 1
+
+    for sec in data.get("fullText", []):
+        section_title = sec.get("title", "").upper().strip()
+        paras = [p.strip() for p in sec.get("paragraphs", []) if p.strip()]
+        if not paras:
+            continue
+        for idx, chunk_text in enumerate(chunker.chunk_paragraphs(paras)):
+            records.append(record(chunk_text, section_title, idx))
+
+    return records, skipped_small, truncated_large
+
+
+# Chunker of the current worker process (or of a serial run)
+_worker_chunker = None
+
+
+def _init_worker(tokenizer_name: str, min_tokens: int, max_tokens: int):
+    global _worker_chunker
+    from transformers import AutoTokenizer
+
+    _worker_chunker = Chunker(AutoTokenizer.from_pretrained(tokenizer_name), min_tokens, max_tokens)
+
+
+# (json lines, skipped, truncated, error) for one file; errors are returned, not raised
+def _chunk_file(path: str) -> tuple[list[str], int, int, str | None]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        records, skipped, truncated = chunk_ruling(data, _worker_chunker)
+    except Exception as e:
+        return [], 0, 0, f"{type(e).__name__}: {e}"
+    return [json.dumps(r, ensure_ascii=False) + "\n" for r in records], skipped, truncated, None
+
+
+# Chunks every ruling in `input_dir` into `output_file` (JSON lines). Files are
+# handed to `workers` processes, each loading the tokenizer once; results are
+# written in sorted file-name order whatever the number of workers, so the
+# output is deterministic. At most `workers` x 4 files are in flight.
+# Per-file errors end up in "failures" instead of stopping the run.
+def chunk_files(input_dir: str, output_file: str, workers: int = 1, min_tokens: int = MIN_TOKENS,
+                max_tokens: int = MAX_TOKENS, tokenizer_name: str = TOKENIZER_NAME, progress=None) -> dict:
+    filenames = sorted(name for name in os.listdir(input_dir) if name.endswith(".json"))
+    paths = [os.path.join(input_dir, name) for name in filenames]
+    stats = {"files": len(paths), "total_chunks": 0, "skipped_small": 0, "truncated_large": 0, "failures": []}
+    init_args = (tokenizer_name, min_tokens, max_tokens)
+
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args)
+        window = workers * 4
+    else:
+        _init_worker(*init_args)
+        executor = None
+
+    with open(output_file, "w", encoding="utf-8") as fout:
+        try:
+            if executor is None:
+                results = map(_chunk_file, paths)
+            else:
+                results = _ordered_results(executor, paths, window)
+
+            for filename, (lines, skipped, truncated, error) in zip(filenames, results):
+                if error is not None:
+                    stats["failures"].append({"file": filename, "error": error})
+                else:
+                    fout.writelines(lines)
+                    stats["total_chunks"] += len(lines)
+                    stats["skipped_small"] += skipped
+                    stats["truncated_large"] += truncated
+                if progress is not None:
+                    progress(1)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    return stats
+
+
+# Results of _chunk_file in input order, keeping at most `window` files submitted
+def _ordered_results(executor: ProcessPoolExecutor, paths: list[str], window: int):
+    pending = deque()
+    for path in paths:
+        pending.append(executor.submit(_chunk_file, path))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
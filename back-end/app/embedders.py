@@ -0,0 +1,297 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+
+# Coalesces concurrent encode requests into micro-batches on one worker thread.
+# A batch is flushed as soon as it holds `max_batch_size` texts or `max_wait_ms`
+# has passed since its first request, so a lone request waits at most
+# `max_wait_ms` and requests arriving together share one forward pass.
+class MicroBatcher:
+    def __init__(self, encode, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "texts": 0,
+            "batches": 0,
+            "failures": 0,
+            "queue_seconds": 0.0,
+            "encode_seconds": 0.0,
+        }
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._counters[key] += value
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    # Future resolving to one vector per text
+    def submit(self, texts: list[str]) -> Future:
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((list(texts), future, time.perf_counter()))
+        return future
+
+    def embed(self, texts: list[str]) -> list[np.ndarray]:
+        return self.submit(texts).result()
+
+    async def aembed(self, texts: list[str]) -> list[np.ndarray]:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    # Blocks for the first request, then keeps collecting until the batch is full
+    # or the wait budget of that first request is spent. Requests already queued
+    # (a backlog that built up during the previous encode) are taken without waiting.
+    def _next_batch(self) -> list[tuple]:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = batch[0][2] + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        # Requests whose caller gave up (cancelled async task) are dropped
+        return [item for item in batch if item[1].set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            texts = [text for item in batch for text in item[0]]
+            self._count(
+                requests=len(batch),
+                texts=len(texts),
+                batches=1,
+                queue_seconds=sum(started - item[2] for item in batch),
+            )
+            try:
+                vectors = self.encode(texts)
+            except Exception as e:
+                self._count(failures=1)
+                for _, future, _ in batch:
+                    future.set_exception(RuntimeError(f"Local embedding failed: {str(e)}"))
+                continue
+            self._count(encode_seconds=time.perf_counter() - started)
+
+            offset = 0
+            for item_texts, future, _ in batch:
+                future.set_result(list(vectors[offset:offset + len(item_texts)]))
+                offset += len(item_texts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        batches = counters["batches"] or 1
+        requests = counters["requests"] or 1
+        return {
+            **counters,
+            "pending": self._queue.qsize(),
+            "avg_batch_texts": counters["texts"] / batches,
+            "avg_batch_requests": counters["requests"] / batches,
+            "avg_queue_ms": counters["queue_seconds"] / requests * 1000,
+            "avg_encode_ms": counters["encode_seconds"] / batches * 1000,
+        }
+
+
+# Written next to the ONNX export by _pipeline/2.1_export_onnx_model.py:
+# {"model", "file_name", "quantization", "parity"}
+ONNX_MANIFEST_FILE = "onnx_export.json"
+
+
+# The sentence-transformers model, or its (int8) ONNX export when `onnx_dir` is
+# set. Both produce vectors in the same space, so the pipeline and the query
+# embedders can switch independently.
+# `threads` caps the intra-op threads of this model (torch or onnxruntime).
+def load_sentence_transformer(model_name: str, device: str = "cpu", onnx_dir: str | None = None,
+                              threads: int | None = None):
+    from sentence_transformers import SentenceTransformer
+
+    if not onnx_dir:
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name, device=device)
+
+    manifest_path = os.path.join(onnx_dir, ONNX_MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise RuntimeError(f"No ONNX export in {onnx_dir}; run _pipeline/2.1_export_onnx_model.py")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest["model"] != model_name:
+        raise RuntimeError(f"ONNX export in {onnx_dir} is of {manifest['model']}, expected {model_name}")
+
+    model_kwargs = {"file_name": manifest["file_name"]}
+    if threads:
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        model_kwargs["session_options"] = options
+    return SentenceTransformer(onnx_dir, device=device, backend="onnx", model_kwargs=model_kwargs)
+
+
+# In-process sentence-transformers model (or its ONNX export) behind a
+# MicroBatcher. Vectors are L2-normalized, matching the corpus written by
+# _pipeline/3_embed_json_chunks.py.
+class LocalEmbedder:
+    def __init__(self, model_name: str, device: str = "cpu", max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 onnx_dir: str | None = None):
+        self.model_name = model_name
+        self.backend = "onnx" if onnx_dir else "torch"
+        self.model = load_sentence_transformer(model_name, device=device, onnx_dir=onnx_dir)
+        self.batcher = MicroBatcher(self._encode, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=self.batcher.max_batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        ).astype(np.float32, copy=False)
+
+    def embed(self, texts: list[str]) -> list[np.ndarray]:
+        return self.batcher.embed(texts)
+
+    async def aembed(self, texts: list[str]) -> list[np.ndarray]:
+        return await self.batcher.aembed(texts)
+
+    def stats(self) -> dict:
+        return {"model": self.model_name, "backend": self.backend, **self.batcher.stats()}
+
+
+# Model of the current EncodingPool worker process
+_worker_model = None
+
+
+def _init_encoding_worker(model_name: str, device: str, onnx_dir: str | None, threads: int):
+    global _worker_model
+    _worker_model = load_sentence_transformer(model_name, device=device, onnx_dir=onnx_dir, threads=threads)
+
+
+def _worker_info() -> tuple[int, int]:
+    return _worker_model.get_sentence_embedding_dimension(), _worker_model.max_seq_length
+
+
+def _encode_in_worker(texts: list[str]) -> np.ndarray:
+    return _worker_model.encode(
+        texts,
+        batch_size=len(texts),
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+    ).astype(np.float32, copy=False)
+
+
+# Corpus encoding on several processes, each with its own model and a share of
+# the cores. Texts are sorted by token count and cut into micro-batches of
+# similar length, so little compute goes to padding; the longest batches are
+# dispatched first to balance the workers, and vectors come back in input order.
+# processes=1 encodes in this process with the same bucketing.
+class EncodingPool:
+    def __init__(self, model_name: str, device: str = "cpu", onnx_dir: str | None = None, processes: int = 1,
+                 batch_size: int = 64, threads_per_process: int | None = None):
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        self.processes = processes
+        self.batch_size = batch_size
+        self.threads = threads_per_process or max(1, cores // processes)
+
+        init_args = (model_name, device, onnx_dir, self.threads)
+        if processes > 1:
+            from transformers import AutoTokenizer
+
+            # fork, not spawn: the pipeline scripts run at module level and a
+            # spawned worker would re-run the importing script
+            context = multiprocessing.get_context("fork")
+            self.pool = context.Pool(processes, initializer=_init_encoding_worker, initargs=init_args)
+            self.dim, self.max_length = self.pool.apply(_worker_info)
+            self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir or model_name)
+        else:
+            _init_encoding_worker(*init_args)
+            self.pool = None
+            self.dim, self.max_length = _worker_info()
+            self.tokenizer = _worker_model.tokenizer
+
+        self._counters = {
+            "texts": 0,
+            "seconds": 0.0,
+            "tokens": 0,
+            "padded_tokens": 0,
+            "file_order_padded_tokens": 0,
+        }
+
+    def token_lengths(self, texts: list[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length, return_length=True)
+        return np.asarray(encoded["length"], dtype=np.int64)
+
+    def _padded(self, lengths: np.ndarray, batches: list[np.ndarray]) -> int:
+        return int(sum(len(batch) * lengths[batch].max() for batch in batches))
+
+    # One L2-normalized vector per text, in input order
+    def encode(self, texts: list[str]) -> np.ndarray:
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return vectors
+
+        started = time.perf_counter()
+        lengths = self.token_lengths(texts)
+        order = np.argsort(-lengths, kind="stable")
+        batches = [order[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        jobs = [[texts[i] for i in batch] for batch in batches]
+
+        results = self.pool.imap(_encode_in_worker, jobs) if self.pool else map(_encode_in_worker, jobs)
+        for batch, batch_vectors in zip(batches, results):
+            vectors[batch] = batch_vectors
+
+        file_order = [
+            np.arange(i, min(i + self.batch_size, len(texts)))
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        self._counters["texts"] += len(texts)
+        self._counters["seconds"] += time.perf_counter() - started
+        self._counters["tokens"] += int(lengths.sum())
+        self._counters["padded_tokens"] += self._padded(lengths, batches)
+        self._counters["file_order_padded_tokens"] += self._padded(lengths, file_order)
+        return vectors
+
+    # Throughput and padding efficiency (real tokens / tokens computed incl.
+    # padding), next to the efficiency the same texts would get in file order
+    def stats(self) -> dict:
+        counters = dict(self._counters)
+        return {
+            **counters,
+            "processes": self.processes,
+            "threads_per_process": self.threads,
+            "chunks_per_sec": counters["texts"] / (counters["seconds"] or 1.0),
+            "padding_efficiency": counters["tokens"] / (counters["padded_tokens"] or 1),
+            "file_order_padding_efficiency": counters["tokens"] / (counters["file_order_padded_tokens"] or 1),
+        }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
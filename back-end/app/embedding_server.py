@@ -0,0 +1,47 @@
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from app.embedders import LocalEmbedder
+from app.env import get_embedding_device, get_embedding_max_batch, get_embedding_max_wait_ms, get_embedding_onnx_dir
+
+# Sidecar that serves the embedding model over the OpenAI-compatible route the
+# API already speaks, so several API workers share one model and its batches:
+#   uvicorn app.embedding_server:app --port 8001
+#   EMBEDDING_URL=http://localhost:8001/v1/openai/embeddings
+app = FastAPI()
+
+# Same model as app.rag (not imported, so the sidecar needs no Supabase config)
+EMBEDDING_MODEL = "intfloat/multilingual-e5-large"
+embedder = LocalEmbedder(
+    EMBEDDING_MODEL,
+    device=get_embedding_device(),
+    max_batch_size=get_embedding_max_batch(),
+    max_wait_ms=get_embedding_max_wait_ms(),
+    onnx_dir=get_embedding_onnx_dir()
+)
+
+
+class EmbeddingRequest(BaseModel):
+    input: str | list[str]
+    model: str | None = None
+    encoding_format: str = "float"
+
+
+@app.post("/v1/openai/embeddings")
+async def create_embeddings(payload: EmbeddingRequest):
+    if payload.model and payload.model != EMBEDDING_MODEL:
+        raise HTTPException(status_code=400, detail=f"Only {EMBEDDING_MODEL} is served")
+    texts = [payload.input] if isinstance(payload.input, str) else payload.input
+    vectors = await embedder.aembed(texts)
+    return {
+        "object": "list",
+        "model": EMBEDDING_MODEL,
+        "data": [
+            {"object": "embedding", "index": i, "embedding": vector.tolist()}
+            for i, vector in enumerate(vectors)
+        ],
+    }
+
+
+@app.get("/metrics")
+def get_metrics():
+    return embedder.stats()
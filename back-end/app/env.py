@@ -6,3 +6,116 @@ load_dotenv()
 def get_memo_table_name():
     env = os.getenv("APP_ENV", "development")
     return "memos_prod" if env == "production" else "memos"
+
+# "supabase" queries the match_case_chunks RPC, "local" scans the memory-mapped
+# index, "ann" searches the HNSW graph built by _pipeline/4_build_ann_index.py and
+# "quantized" scans the compact codes built by _pipeline/5_build_quantized_index.py and
+# "two_stage" ranks rulings first (_pipeline/7_build_ruling_index.py), then their chunks
+def get_retrieval_backend():
+    return os.getenv("RETRIEVAL_BACKEND", "supabase")
+
+# RPC used by the supabase backend: "match_case_chunks" returns MATCH_COUNT candidates
+# that are capped per ECLI in Python, "match_case_chunks_v2" does the cap in SQL
+# (see _utils/supabase_match_case_chunks_v2.sql) and returns only top_k rows
+def get_match_rpc():
+    return os.getenv("MATCH_RPC", "match_case_chunks")
+
+# Wire format of query vectors: "text" (pgvector literal), "f32b64" or "f16b64".
+# The base64 formats go through the match_case_chunks_packed RPC
+# (_utils/supabase_decode_query_vector.sql) regardless of MATCH_RPC.
+def get_query_vector_encoding():
+    return os.getenv("QUERY_VECTOR_ENCODING", "text")
+
+def get_vector_index_dir():
+    return os.getenv("VECTOR_INDEX_DIR", "_data/vector_index")
+
+# HNSW search breadth: higher means better recall and slower queries
+def get_ann_ef_search():
+    return int(os.getenv("ANN_EF_SEARCH", "64"))
+
+# Quantized backend: candidates rescored exactly = factor x match count
+def get_quantized_rescore_factor():
+    return int(os.getenv("QUANTIZED_RESCORE_FACTOR", "4"))
+
+# Two-stage backend: rulings whose chunks are searched in the second stage
+def get_two_stage_rulings():
+    return int(os.getenv("TWO_STAGE_RULINGS", "20"))
+
+# Hybrid retrieval: BM25 over the index built by _pipeline/6_build_sparse_index.py,
+# fused with the dense results by reciprocal rank (RRF_K dampens the top ranks)
+def get_hybrid_retrieval():
+    return os.getenv("HYBRID_RETRIEVAL", "false").lower() == "true"
+
+def get_rrf_k():
+    return int(os.getenv("RRF_K", "60"))
+
+# Query-embedding cache: in-memory LRU size, and the on-disk tier (empty path disables it)
+def get_embedding_cache_size():
+    return int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+
+def get_embedding_cache_path():
+    return os.getenv("EMBEDDING_CACHE_PATH", "_data/embedding_cache.sqlite3") or None
+
+def get_embedding_cache_disk_size():
+    return int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "100000"))
+
+# Number of stored chunk vectors kept in memory for grounding evaluation
+def get_chunk_embedding_cache_size():
+    return int(os.getenv("CHUNK_EMBEDDING_CACHE_SIZE", "4096"))
+
+# DeepInfra transport: per-attempt timeout, overall deadline per call (seconds),
+# retries on 429/5xx/connection errors and connection pool size
+def get_deep_infra_timeout():
+    return float(os.getenv("DEEP_INFRA_TIMEOUT", "30"))
+
+def get_deep_infra_deadline():
+    return float(os.getenv("DEEP_INFRA_DEADLINE", "60"))
+
+def get_deep_infra_max_retries():
+    return int(os.getenv("DEEP_INFRA_MAX_RETRIES", "3"))
+
+def get_deep_infra_max_connections():
+    return int(os.getenv("DEEP_INFRA_MAX_CONNECTIONS", "20"))
+
+# Query/passage embeddings: "deepinfra" (default) posts to EMBEDDING_URL, an
+# OpenAI-compatible endpoint (DeepInfra, or the app.embedding_server sidecar);
+# "local" runs the model in-process with micro-batching
+def get_embedding_backend():
+    return os.getenv("EMBEDDING_BACKEND", "deepinfra").lower()
+
+def get_embedding_url():
+    return os.getenv("EMBEDDING_URL", "https://api.deepinfra.com/v1/openai/embeddings")
+
+def get_embedding_device():
+    return os.getenv("EMBEDDING_DEVICE", "cpu")
+
+# Directory of the ONNX export from _pipeline/2.1_export_onnx_model.py; when set,
+# the local backend (and the embedding pipeline) run it instead of the torch model
+def get_embedding_onnx_dir():
+    return os.getenv("EMBEDDING_ONNX_DIR") or None
+
+# Local micro-batches: flushed at this many texts or after this many milliseconds
+def get_embedding_max_batch():
+    return int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+
+def get_embedding_max_wait_ms():
+    return float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+
+# How long (seconds) the Supabase corpus version is trusted before it is re-read
+def get_corpus_version_ttl():
+    return float(os.getenv("CORPUS_VERSION_TTL", "60"))
+
+# Generated-memo cache: max entries, entry lifetime in seconds, and the query
+# similarity above which a different form may reuse a memo for the same chunks
+def get_memo_cache_size():
+    return int(os.getenv("MEMO_CACHE_SIZE", "512"))
+
+def get_memo_cache_ttl():
+    return float(os.getenv("MEMO_CACHE_TTL", "86400"))
+
+def get_memo_cache_similarity():
+    return float(os.getenv("MEMO_CACHE_SIMILARITY", "0.98"))
+
+# Retrieval results per (query vector, top_k, max_per_ecli, threshold); 0 disables
+def get_retrieval_cache_size():
+    return int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
@@ -1,27 +1,51 @@
 import re
 from typing import List
 from nltk.tokenize import sent_tokenize
-from sklearn.metrics.pairwise import cosine_similarity
-from app.rag import embed_query  
 import nltk
-from scipy.spatial import distance
 import numpy as np
-from app.rag import embed_batch 
+from app.rag import aembed_batch, afetch_chunk_embeddings
 
 nltk.download('punkt', quiet=True)
 nltk.download('punkt_tab', quiet=True)
 
 
-def compute_similarity(vec1, vec2, metric="cosine") -> float:
+SIMILARITY_METRICS = ["cosine", "dot", "euclidean"]
+
+# Scores every sentence against every chunk (cosine, dot, or exp(-euclidean distance)).
+# All three metrics derive from the one Gram matrix S @ C.T, so the whole grid
+# costs a single BLAS call (cosine/euclidean only add the row norms).
+def compute_similarity_matrix(sentence_vecs, chunk_vecs, metric="cosine") -> np.ndarray:
+    S = np.asarray(sentence_vecs, dtype=np.float32)
+    C = np.asarray(chunk_vecs, dtype=np.float32)
+    gram = S @ C.T
+
+    if metric == "dot":
+        return gram
+
+    s_norms = np.linalg.norm(S, axis=1)
+    c_norms = np.linalg.norm(C, axis=1)
     if metric == "cosine":
-        return 1 - distance.cosine(vec1, vec2)
-    elif metric == "dot":
-        return np.dot(vec1, vec2)
+        denom = np.outer(s_norms, c_norms)
+        return np.divide(gram, denom, out=np.zeros_like(gram), where=denom > 0)
     elif metric == "euclidean":
-        return np.exp(-distance.euclidean(vec1, vec2))  # normalized
+        squared = s_norms[:, None] ** 2 + c_norms[None, :] ** 2 - 2 * gram
+        return np.exp(-np.sqrt(np.maximum(squared, 0.0)))  # normalized
     else:
         raise ValueError(f"Unsupported metric: {metric}")
 
+# For each sentence: its best score over all chunks, which chunk that was,
+# and whether it falls below the grounding threshold. A column of thresholds
+# (shape T x 1) gives one ungrounded row per threshold from the same matrix.
+def score_sentences(sentence_vecs, chunk_vecs, threshold: float | np.ndarray, metric: str = "cosine") -> dict:
+    sims = compute_similarity_matrix(sentence_vecs, chunk_vecs, metric)
+    best_chunk = sims.argmax(axis=1)
+    max_scores = sims[np.arange(sims.shape[0]), best_chunk]
+    return {
+        "max_scores": max_scores,
+        "best_chunk": best_chunk,
+        "ungrounded": max_scores < threshold,
+    }
+
 # Extracts and cleans all valid ECLI citations from the input text.
 # Removes trailing punctuation and ensures each match ends in digits.
 def extract_eclis_from_text(text: str) -> list[str]:
@@ -56,60 +80,95 @@ def count_fabricated_eclis(cited: List[str], retrieved: List[str]) -> int:
     return sum(1 for e in cited if e not in retrieved)
 
 
-def get_ungrounded_sentences(
-    memo: str,
-    chunks: List[dict],
-    threshold: float = 0.70,
-    similarity_metric: str = "cosine"
-) -> list[str]:
-    sentences = sent_tokenize(memo)
-    chunk_texts = [c["text"] for c in chunks]
-
-    sentence_embeddings = embed_batch(sentences)
-    chunk_embeddings = embed_batch(chunk_texts)
+# Uses the vectors stored for each chunk at ingestion time (same e5 model and
+# "passage: " prefix) and only embeds chunks that cannot be resolved by id.
+async def aresolve_chunk_embeddings(chunks: List[dict]) -> list[np.ndarray]:
+    stored = await afetch_chunk_embeddings([c.get("id") for c in chunks])
 
-    ungrounded_sentences = []
-    for sentence, sent_vec in zip(sentences, sentence_embeddings):
-        sims = [compute_similarity(sent_vec, chunk_vec, similarity_metric) for chunk_vec in chunk_embeddings]
-        if max(sims) < threshold:
-            ungrounded_sentences.append(sentence)
+    missing = [i for i, vec in enumerate(stored) if vec is None]
+    if missing:
+        embedded = await aembed_batch([chunks[i]["text"] for i in missing])
+        for i, vec in zip(missing, embedded):
+            stored[i] = vec
 
-    return ungrounded_sentences
+    return stored
 
-def evaluate_memo(
+# Runs every (similarity_metric, threshold) configuration against one memo.
+# Sentences and chunks are embedded once and each metric's similarity matrix is
+# computed once; thresholds only re-cut the per-sentence best scores, which are
+# returned so further thresholds can be applied offline.
+async def aevaluate_memo_sweep(
     memo: str,
     chunks: List[dict],
-    threshold: float = 0.70,
-    similarity_metric: str = "cosine"
+    similarity_metrics: List[str],
+    thresholds: List[float]
 ) -> dict:
+    _check_metrics(similarity_metrics)
+    sentences = sent_tokenize(memo)
+    sentence_embeddings, chunk_embeddings = [], []
+    if sentences:
+        sentence_embeddings = await aembed_batch(sentences)
+        chunk_embeddings = await aresolve_chunk_embeddings(chunks)
+    return _sweep(memo, chunks, sentences, sentence_embeddings, chunk_embeddings, similarity_metrics, thresholds)
+
+def _check_metrics(similarity_metrics: List[str]):
+    for metric in similarity_metrics:
+        if metric not in SIMILARITY_METRICS:
+            raise ValueError(f"Unsupported metric: {metric}")
+
+def _sweep(memo, chunks, sentences, sentence_embeddings, chunk_embeddings, similarity_metrics, thresholds) -> dict:
     predicted_eclis = extract_eclis_from_text(memo)
     reference_eclis = [c["ecli"] for c in chunks]
 
-    sentences = sent_tokenize(memo)
     precision, recall = compute_precision_recall(predicted_eclis, reference_eclis)
     fabricated = count_fabricated_eclis(predicted_eclis, reference_eclis)
-    ungrounded_sents = get_ungrounded_sentences(memo, chunks, threshold, similarity_metric)
-    ungrounded = len(ungrounded_sents)
+
+    evaluations = []
+    sentence_scores = {}
+    for metric in similarity_metrics:
+        if sentences:
+            # One similarity matrix per metric, cut at every threshold
+            scores = score_sentences(sentence_embeddings, chunk_embeddings, np.asarray(thresholds)[:, None], metric)
+            max_scores, best_chunk, ungrounded_masks = scores["max_scores"], scores["best_chunk"], scores["ungrounded"]
+        else:
+            best_chunk = np.zeros(0, dtype=int)
+            max_scores = np.zeros(0, dtype=np.float32)
+            ungrounded_masks = np.zeros((len(thresholds), 0), dtype=bool)
+
+        sentence_scores[metric] = {
+            "max_scores": [float(x) for x in max_scores],
+            "best_chunk_ids": [chunks[j].get("id") for j in best_chunk],
+        }
+
+        for threshold, ungrounded_mask in zip(thresholds, ungrounded_masks):
+            ungrounded_sents = [s for s, ungrounded in zip(sentences, ungrounded_mask) if ungrounded]
+            ungrounded = len(ungrounded_sents)
+
+            evaluations.append({
+                # Citation metrics
+                "citation_precision": precision,
+                "citation_recall": recall,
+                "predicted_eclis": list(set(predicted_eclis)),
+                "reference_eclis": list(set(reference_eclis)),
+                "fabricated_eclis": fabricated,
+
+                # Grounding metrics
+                "ungrounded_statements": ungrounded,
+                "ungrounded_sentences": ungrounded_sents,
+                "hallucinated": fabricated > 0 or ungrounded > 0,
+
+                # Experiment parameters
+                "threshold": threshold,
+                "similarity_metric": metric,
+
+                # Contextual logging
+                "num_sentences": len(sentences),
+                "num_chunks": len(chunks),
+                "ungrounded_ratio": ungrounded / len(sentences) if sentences else 0.0
+            })
 
     return {
-        # Citation metrics
-        "citation_precision": precision,
-        "citation_recall": recall,
-        "predicted_eclis": list(set(predicted_eclis)),
-        "reference_eclis": list(set(reference_eclis)),
-        "fabricated_eclis": fabricated,
-
-        # Grounding metrics
-        "ungrounded_statements": ungrounded,
-        "ungrounded_sentences": ungrounded_sents,
-        "hallucinated": fabricated > 0 or ungrounded > 0,
-
-        # Experiment parameters
-        "threshold": threshold,
-        "similarity_metric": similarity_metric,
-
-        # Contextual logging
-        "num_sentences": len(sentences),
-        "num_chunks": len(chunks),
-        "ungrounded_ratio": ungrounded / len(sentences) if sentences else 0.0
-    }
\ No newline at end of file
+        "evaluations": evaluations,
+        "sentences": sentences,
+        "sentence_scores": sentence_scores
+    }
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+from itertools import islice
+from uuid import UUID, uuid5
+import numpy as np
+from app.vector_index import LocalVectorIndex
+
+# Chunk ids are derived from the chunk's content hash, so re-running ingestion
+# on an unchanged chunks.jsonl yields the same ids and only new or edited chunks
+# need embedding. Fixed namespace: changing it re-keys the whole corpus.
+CHUNK_ID_NAMESPACE = UUID("5b0c3f62-4f7e-4c0e-9a57-3d1f8e2a6c41")
+
+# Page size for reading ids and batch size for id-list filters (kept small so
+# the PostgREST query string stays well under URL length limits)
+ID_PAGE_SIZE = 1000
+ID_BATCH_SIZE = 200
+
+# Progress of an interrupted ingestion run, kept in the vector index directory
+CHECKPOINT_FILE = "ingest_checkpoint.json"
+
+
+# sha256 over what determines a chunk's embedding and its place in the ruling
+def chunk_content_hash(record: dict, model_name: str) -> str:
+    meta = record.get("metadata") or {}
+    key = [
+        record.get("ecli", ""),
+        meta.get("section", ""),
+        meta.get("chunk_index"),
+        meta.get("sub_chunk_index"),
+        record["text"],
+        model_name,
+    ]
+    return hashlib.sha256(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def chunk_id(record: dict, model_name: str) -> str:
+    return str(uuid5(CHUNK_ID_NAMESPACE, chunk_content_hash(record, model_name)))
+
+
+# Every chunk id currently in `table`
+def fetch_stored_ids(supabase, table: str = "case_chunks") -> set[str]:
+    ids = set()
+    start = 0
+    while True:
+        response = supabase.table(table).select("id").order("id").range(start, start + ID_PAGE_SIZE - 1).execute()
+        ids.update(str(row["id"]) for row in response.data)
+        if len(response.data) < ID_PAGE_SIZE:
+            return ids
+        start += ID_PAGE_SIZE
+
+
+def _parse_pgvector(value) -> np.ndarray:
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.array(value, dtype=np.float32)
+
+
+# Stored embeddings by id, for chunks that are in Supabase but not in the local index
+def fetch_stored_embeddings(supabase, ids: list[str], table: str = "case_chunks") -> dict[str, np.ndarray]:
+    found = {}
+    for i in range(0, len(ids), ID_BATCH_SIZE):
+        response = supabase.table(table).select("id, embedding").in_("id", ids[i:i + ID_BATCH_SIZE]).execute()
+        for row in response.data:
+            found[str(row["id"])] = _parse_pgvector(row["embedding"])
+    return found
+
+
+def delete_rows(supabase, ids: list[str], table: str = "case_chunks") -> int:
+    deleted = 0
+    for i in range(0, len(ids), ID_BATCH_SIZE):
+        batch = ids[i:i + ID_BATCH_SIZE]
+        supabase.table(table).delete().in_("id", batch).execute()
+        deleted += len(batch)
+    return deleted
+
+
+# Row of every chunk id in the previous run's local index plus its (memory-mapped)
+# vectors, so unchanged chunks are not re-encoded. Empty when there is no local
+# index or it was built with another model.
+def load_previous_vectors(index_dir: str, model_name: str) -> tuple[dict[str, int], np.ndarray | None]:
+    if not os.path.exists(os.path.join(index_dir, "manifest.json")):
+        return {}, None
+    index = LocalVectorIndex(index_dir)
+    if index.manifest.get("model") != model_name:
+        return {}, None
+    return dict(index.id_to_row), index.vectors
+
+
+# What a run has to do, given the chunk ids it wants and the ids already stored:
+#  - embed:  wanted ids with no known vector (neither local nor in Supabase)
+#  - fetch:  wanted ids whose vector is only in Supabase
+#  - upsert: wanted ids missing from Supabase
+#  - delete: stored ids no longer wanted
+def plan_ingestion(wanted: list[str], stored: set[str], local: set[str]) -> dict:
+    wanted_set = set(wanted)
+    return {
+        "embed": [i for i in wanted if i not in local and i not in stored],
+        "fetch": [i for i in wanted if i not in local and i in stored],
+        "upsert": [i for i in wanted if i not in stored],
+        "delete": sorted(stored - wanted_set),
+        "unchanged": sum(1 for i in wanted if i in stored),
+    }
+
+
+# sha256 of a file, read in blocks; a checkpoint only resumes the same input
+def file_fingerprint(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# (chunk id, record) for every line of chunks.jsonl, first occurrence of an id only
+def iter_chunk_records(path: str, model_name: str):
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            key = chunk_id(record, model_name)
+            if key not in seen:
+                seen.add(key)
+                yield key, record
+
+
+def batched(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# JSON state of the last committed batch, replaced atomically on every save
+class Checkpoint:
+    def __init__(self, path: str):
+        self.path = path
+        self.state = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    # Saved state for the same input file, model and batch size, or None
+    def resumable(self, fingerprint: str, model_name: str, batch_size: int) -> dict | None:
+        saved = self.state or {}
+        if (saved.get("fingerprint"), saved.get("model"), saved.get("batch_size")) != (fingerprint, model_name, batch_size):
+            return None
+        return self.state
+
+    def save(self, **state):
+        self.state = state
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.state = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# Upserts one batch, retrying with exponential backoff; raises once retries run out
+def upsert_with_retries(supabase, rows: list[dict], table: str = "case_chunks", retries: int = 5,
+                        backoff: float = 1.0):
+    for attempt in range(retries + 1):
+        try:
+            supabase.table(table).upsert(rows).execute()
+            return
+        except Exception as e:
+            if attempt == retries:
+                raise RuntimeError(f"Upload of {len(rows)} rows failed after {retries + 1} attempts: {e}") from e
+            time.sleep(min(backoff * 2 ** attempt, 30.0))
+
+
+# Uploads numbered batches on a few writer threads, `request_rows` rows per
+# upsert. At most 2 x `writers` requests are in flight (the producer blocks
+# beyond that, which bounds memory), and `committed` is the length of the prefix
+# of batches that are all uploaded: everything before it is durable and never
+# has to be redone on resume.
+class BatchUploader:
+    def __init__(self, supabase, table: str = "case_chunks", writers: int = 4, retries: int = 5,
+                 start: int = 0, request_rows: int = 500):
+        self.supabase = supabase
+        self.table = table
+        self.retries = retries
+        self.request_rows = request_rows
+        self.max_pending = writers * 2
+        self.executor = ThreadPoolExecutor(max_workers=writers, thread_name_prefix="ingest-writer")
+        self.pending = {}
+        self.outstanding = {}
+        self.done = set()
+        self.committed = start
+        self.uploaded = 0
+
+    def _collect(self, return_when):
+        finished, _ = wait(list(self.pending), return_when=return_when)
+        for future in finished:
+            batch_no, count = self.pending.pop(future)
+            future.result()
+            self.uploaded += count
+            self.outstanding[batch_no] -= 1
+            if self.outstanding[batch_no] == 0:
+                del self.outstanding[batch_no]
+                self.done.add(batch_no)
+
+    def _advance(self) -> int:
+        while self.committed in self.done:
+            self.done.remove(self.committed)
+            self.committed += 1
+        return self.committed
+
+    # Queues batch `batch_no` (an empty batch completes at once); returns `committed`
+    def submit(self, batch_no: int, rows: list[dict]) -> int:
+        parts = [rows[i:i + self.request_rows] for i in range(0, len(rows), self.request_rows)]
+        if parts:
+            self.outstanding[batch_no] = len(parts)
+        else:
+            self.done.add(batch_no)
+        for part in parts:
+            future = self.executor.submit(upsert_with_retries, self.supabase, part, self.table, self.retries)
+            self.pending[future] = (batch_no, len(part))
+            while len(self.pending) >= self.max_pending:
+                self._collect(FIRST_COMPLETED)
+        return self._advance()
+
+    # Waits for every queued batch; returns `committed`
+    def drain(self) -> int:
+        if self.pending:
+            self._collect(ALL_COMPLETED)
+        return self._advance()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
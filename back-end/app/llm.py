@@ -0,0 +1,67 @@
+import os
+import threading
+import httpx
+import certifi
+from langchain_openai import ChatOpenAI
+from langchain_anthropic import ChatAnthropic
+from langchain_core.prompts import ChatPromptTemplate
+
+# Shared connection pools for every OpenAI client in the registry
+http_client = httpx.Client(verify=certifi.where())
+# Used by the async endpoints, so a slow LLM call does not hold a threadpool thread
+async_http_client = httpx.AsyncClient(verify=certifi.where())
+
+MEMO_MODEL = "gpt-4.1"
+MEMO_TEMPERATURE = 0.2
+
+# Reviewer models accepted by /refine-existing-memo
+REVIEW_MODELS = ("gpt-4.1", "claude-4-sonnet")
+
+# Prompt templates are compiled once at import instead of per request
+MEMO_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Je bent een juridisch assistent gespecialiseerd in Nederlandse sociale zekerheidszaken. Je schrijft juridisch correcte en duidelijke memo's gebaseerd op gerechtelijke uitspraken."),
+    ("user", "{memo_input}")
+])
+
+REVIEW_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Je bent een juridisch assistent gespecialiseerd in Nederlandse sociale zekerheidszaken. Je controleert of een memo juridisch correct en goed onderbouwd is."),
+    ("user", "{review_input}")
+])
+
+# Process-wide chat clients keyed by (provider, model, temperature)
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_provider(model_name: str) -> str:
+    return "anthropic" if model_name.startswith("claude") else "openai"
+
+
+def _build_chat_model(provider: str, model_name: str, temperature: float):
+    if provider == "anthropic":
+        return ChatAnthropic(
+            model=model_name,
+            temperature=temperature,
+            anthropic_api_key=os.environ["ANTHROPIC_API_KEY"]
+        )
+    return ChatOpenAI(
+        model=model_name,
+        temperature=temperature,
+        http_client=http_client,
+        http_async_client=async_http_client
+    )
+
+
+# Returns the shared client for this configuration, building it on first use
+def get_chat_model(model_name: str, temperature: float):
+    provider = get_provider(model_name)
+    key = (provider, model_name, float(temperature))
+
+    chat = _clients.get(key)
+    if chat is None:
+        with _clients_lock:
+            chat = _clients.get(key)
+            if chat is None:
+                chat = _build_chat_model(provider, model_name, float(temperature))
+                _clients[key] = chat
+    return chat
@@ -1,21 +1,41 @@
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Literal
 from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from app.rag import supabase
+from app.rag import supabase, get_async_supabase
 from app.models import MemoRequest
 from app.prompt import build_query, build_prompt
-from app.rag import embed_query, retrieve_chunks, generate_memo
-from app.evaluation import evaluate_memo
+from app.rag import aembed_query, aretrieve_chunks, agenerate_memo, astream_memo
+from app.evaluation import aevaluate_memo_sweep
 from fastapi import Body, HTTPException
 from app.env import get_memo_table_name
 from datetime import datetime
 from fastapi import Query
-from app.rag import refine_memo
+from app.rag import arefine_memo
+from app.llm import REVIEW_MODELS
+from app.rag import query_embedding_cache, embedding_transport, retrieval_cache, aget_corpus_version, local_embedder_stats
+from app.rag import aget_local_embedder, load_retrieval_indexes
+from app.cache import MemoCache
+from app.metadata_index import MetadataIndex
+from app.env import get_memo_cache_size, get_memo_cache_ttl, get_memo_cache_similarity, get_embedding_backend
+
+# The local embedding model (EMBEDDING_BACKEND=local) and the retrieval indexes
+# are loaded off the event loop before the first request is served
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if get_embedding_backend() == "local":
+        await aget_local_embedder()
+    await asyncio.to_thread(load_retrieval_indexes)
+    yield
 
 # Initialize FastAPI and limiter
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
@@ -29,27 +49,119 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Generated memos, reused for repeated or near-identical forms until the corpus changes
+memo_cache = MemoCache(
+    max_entries=get_memo_cache_size(),
+    ttl_seconds=get_memo_cache_ttl(),
+    similarity_threshold=get_memo_cache_similarity()
+)
+
+# Builds the query and looks it up in the memo cache: first by exact (normalized)
+# query text, then after embedding and retrieval by query similarity over the
+# same chunk set. On a miss, returns what is needed to generate and cache the memo.
+async def prepare_memo(payload: MemoRequest) -> dict:
+    query = build_query(payload.model_dump())
+    filters = MetadataIndex.normalize_filters(payload.filters.model_dump(exclude_none=True)) if payload.filters else None
+    cache_key = MemoCache.make_key(query, filters)
+    corpus_version = await aget_corpus_version()
+
+    cached = memo_cache.get_exact(cache_key, corpus_version)
+    if cached is not None:
+        return {"memo": cached["memo"], "chunks": cached["chunks"]}
+
+    vector = await aembed_query(query)
+    chunks = await aretrieve_chunks(vector, top_k=6, max_per_ecli=2, query_text=query, filters=filters)
+
+    cached = memo_cache.get_similar(vector, chunks, corpus_version)
+    if cached is not None:
+        return {"memo": cached["memo"], "chunks": chunks}
+
+    return {
+        "memo": None,
+        "chunks": chunks,
+        "full_prompt": build_prompt(query, chunks),
+        "cache_key": cache_key,
+        "vector": vector,
+        "corpus_version": corpus_version
+    }
+
+def cache_memo(prepared: dict, memo: str):
+    memo_cache.put(
+        prepared["cache_key"], prepared["vector"], prepared["chunks"], memo, prepared["corpus_version"]
+    )
+
 @app.post("/generate-memo")
 @limiter.limit("5/minute")  # Limit each IP to 5 requests per minute
-def generate_legal_memo(payload: MemoRequest, request: Request):
-    query = build_query(payload.model_dump())
-    vector = embed_query(query)
-    chunks = retrieve_chunks(vector, top_k=6, max_per_ecli=2)
-    full_prompt = build_prompt(query, chunks)
-    memo = generate_memo(full_prompt)
-    return {"memo": memo, "chunks": chunks}
+async def generate_legal_memo(payload: MemoRequest, request: Request):
+    prepared = await prepare_memo(payload)
+    if prepared["memo"] is not None:
+        return {"memo": prepared["memo"], "chunks": prepared["chunks"]}
+
+    memo = await agenerate_memo(prepared["full_prompt"])
+    cache_memo(prepared, memo)
+    return {"memo": memo, "chunks": prepared["chunks"]}
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Streaming variant of /generate-memo as server-sent events:
+#   "chunks" with the retrieved chunks as soon as retrieval is done,
+#   "token" for each piece of memo text, then "done" with the complete memo
+#   (or "error" if generation fails midway). A cached memo arrives as one token.
+@app.post("/generate-memo/stream")
+@limiter.limit("5/minute")
+async def generate_legal_memo_stream(payload: MemoRequest, request: Request):
+    prepared = await prepare_memo(payload)
+    chunks = prepared["chunks"]
+
+    async def events():
+        yield _sse_event("chunks", {"chunks": chunks})
+        if prepared["memo"] is not None:
+            yield _sse_event("token", {"text": prepared["memo"]})
+            yield _sse_event("done", {"memo": prepared["memo"], "chunks": chunks})
+            return
+
+        parts = []
+        try:
+            async for text in astream_memo(prepared["full_prompt"]):
+                parts.append(text)
+                yield _sse_event("token", {"text": text})
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Generation failed: {str(e)}"})
+            return
+
+        memo = "".join(parts)
+        cache_memo(prepared, memo)
+        yield _sse_event("done", {"memo": memo, "chunks": chunks})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx-style proxies from buffering the stream
+            "X-Accel-Buffering": "no",
+        }
+    )
 
 @app.post("/refine-existing-memo")
 @limiter.limit("5/minute")
-def refine_existing_memo(request: Request, payload: dict = Body(...)):
+async def refine_existing_memo(request: Request, payload: dict = Body(...)):
     memo_raw = payload.get("memo")
     chunks = payload.get("chunks")
+    temperature = payload.get("temperature", 0.2)
+    model_name = payload.get("model", "gpt-4.1")
     
     if not memo_raw or not chunks:
         raise HTTPException(status_code=400, detail="Missing memo or chunks")
+    if model_name not in REVIEW_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unsupported model: {model_name}")
+    # bool is an int subclass; true/false must not pass as 1.0/0.0
+    if isinstance(temperature, bool) or not isinstance(temperature, (int, float)) or not 0.0 <= temperature <= 1.0:
+        raise HTTPException(status_code=400, detail="Temperature must be a number between 0 and 1")
 
     try:
-        memo_refined = refine_memo(memo_raw, chunks)
+        memo_refined = await arefine_memo(memo_raw, chunks, temperature=round(temperature, 2), model_name=model_name)
         return {"memo_refined": memo_refined, "chunks": chunks}
 
     except Exception as e:
@@ -90,10 +202,12 @@ async def save_memo(request: Request):
     memo_id = body["id"]
     table_name = get_memo_table_name()
 
+    client = await get_async_supabase()
+
     # Check if memo exists
-    existing = supabase.table(table_name).select("id").eq("id", memo_id).execute()
+    existing = await client.table(table_name).select("id").eq("id", memo_id).execute()
     if existing.data:
-        supabase.table(table_name).update({
+        await client.table(table_name).update({
             "content": body["content"],
             "form_data": body["formData"],
             "chunks": body["chunks"],
@@ -101,7 +215,7 @@ async def save_memo(request: Request):
             "updated_at": body.get("updatedAt"),
         }).eq("id", memo_id).execute()
     else:
-        supabase.table(table_name).insert({
+        await client.table(table_name).insert({
             "id": memo_id,
             "content": body["content"],
             "form_data": body["formData"],
@@ -112,55 +226,86 @@ async def save_memo(request: Request):
 
     return { "id": memo_id }
 
-@app.post("/evaluate-memo")
-def evaluate_generated_memo(
-    payload: dict = Body(...),
-    similarity_metric: str = Query(
-        "cosine",
-        enum=["cosine", "dot", "euclidean"],
-        description="Similarity metric to use for sentence grounding"
-    ),
-    threshold: float = Query(
-        0.70,
-        ge=0.0,
-        le=1.0,
-        description="Threshold for similarity to consider a sentence grounded"
-    )
-):
+# Metrics accepted by the evaluation endpoints; anything else is rejected with a 422
+SimilarityMetric = Literal["cosine", "dot", "euclidean"]
+
+def _memo_and_chunks(payload: dict) -> tuple[str, list]:
     memo = payload.get("memo", "")
     chunks = payload.get("chunks", [])
-
     if not memo or not chunks:
         raise HTTPException(status_code=400, detail="Missing memo or chunks")
+    return memo, chunks
 
+# Runs every metric x threshold configuration on a single set of embeddings and
+# logs one evaluation_logs row per configuration in one insert
+async def run_evaluation_sweep(memo: str, chunks: list, metrics: list[str], thresholds: list[float]) -> dict:
     try:
-        # Run evaluation
-        evaluation = evaluate_memo(
+        sweep = await aevaluate_memo_sweep(
             memo=memo,
             chunks=chunks,
-            threshold=threshold,
-            similarity_metric=similarity_metric
+            similarity_metrics=metrics,
+            thresholds=thresholds
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Prepare and insert into Supabase
-        log_entry = {
+    created_at = datetime.utcnow().isoformat()
+    log_entries = [
+        {
             "memo": memo,
             "chunks": chunks,
             "evaluation": evaluation,
-            "similarity_metric": similarity_metric,
-            "threshold": threshold,
-            "created_at": datetime.utcnow().isoformat()
+            "similarity_metric": evaluation["similarity_metric"],
+            "threshold": evaluation["threshold"],
+            "created_at": created_at
         }
+        for evaluation in sweep["evaluations"]
+    ]
 
-        response = supabase.table("evaluation_logs").insert(log_entry).execute()
-        if not response.data:
-            raise HTTPException(status_code=500, detail="Failed to save evaluation to Supabase.")
+    client = await get_async_supabase()
+    response = await client.table("evaluation_logs").insert(log_entries).execute()
+    if not response.data:
+        raise HTTPException(status_code=500, detail="Failed to save evaluation to Supabase.")
+    return sweep
+
+@app.post("/evaluate-memo")
+async def evaluate_generated_memo(
+    payload: dict = Body(...),
+    similarity_metric: SimilarityMetric = Query(
+        "cosine",
+        description="Similarity metric to use for sentence grounding"
+    ),
+    threshold: float = Query(
+        0.70,
+        ge=0.0,
+        le=1.0,
+        description="Threshold for similarity to consider a sentence grounded"
+    )
+):
+    memo, chunks = _memo_and_chunks(payload)
+    sweep = await run_evaluation_sweep(memo, chunks, [similarity_metric], [threshold])
+    return sweep["evaluations"][0]
 
-        return evaluation
+# Every metric x threshold configuration in one request; always returns the
+# sweep ({"evaluations": [...], ...}), however many configurations were asked for
+@app.post("/evaluate-memo/sweep")
+async def evaluate_generated_memo_sweep(
+    payload: dict = Body(...),
+    similarity_metric: list[SimilarityMetric] = Query(
+        ["cosine"],
+        description="Similarity metric(s) to use for sentence grounding. Repeat the parameter to evaluate several"
+    ),
+    threshold: list[float] = Query(
+        [0.70],
+        description="Threshold(s) between 0 and 1 for similarity to consider a sentence grounded. "
+                    "Repeat the parameter to evaluate several"
+    )
+):
+    memo, chunks = _memo_and_chunks(payload)
+    if any(t < 0.0 or t > 1.0 for t in threshold):
+        raise HTTPException(status_code=400, detail="Thresholds must be between 0 and 1")
+    return await run_evaluation_sweep(memo, chunks, similarity_metric, threshold)
 
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    
 @app.get("/evaluation-logs")
 def list_evaluation_logs(limit: int = 100):
     try:
@@ -173,4 +318,14 @@ def list_evaluation_logs(limit: int = 100):
         return response.data
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics")
+def get_metrics():
+    return {
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "embedding_transport": embedding_transport.stats(),
+        "local_embedder": local_embedder_stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "memo_cache": memo_cache.stats()
+    }
@@ -0,0 +1,99 @@
+import json
+import numpy as np
+from app.cache import LRUCache
+
+# Filterable chunk metadata (set by _pipeline/1_chunk_json_data.py). Request
+# filters use the plural names; values match case-insensitively, several values
+# for one field are OR-ed and different fields are AND-ed.
+FILTER_FIELDS = {
+    "courts": "court",
+    "sections": "section",
+    "procedures": "procedure",
+    "subjects": "subject",
+}
+
+
+def _normalize(value) -> str:
+    return str(value or "").strip().casefold()
+
+
+# "YYYY-MM-DD" as an int (20220131) so date ranges become array comparisons;
+# rows without a parseable date get 0 and never satisfy a date filter
+def _date_key(value) -> int:
+    try:
+        return int(str(value)[:10].replace("-", ""))
+    except ValueError:
+        return 0
+
+
+# Posting lists per metadata value plus a sorted date column, built once from
+# the index rows. mask() turns a filter dict into a boolean row mask, so the
+# vector and BM25 scans only score rows that pass.
+class MetadataIndex:
+    def __init__(self, rows: list[dict]):
+        self.count = len(rows)
+        postings = {field: {} for field in FILTER_FIELDS.values()}
+        dates = np.zeros(self.count, dtype=np.int32)
+
+        for i, row in enumerate(rows):
+            meta = row.get("metadata") or {}
+            for field, values in postings.items():
+                values.setdefault(_normalize(meta.get(field)), []).append(i)
+            dates[i] = _date_key(meta.get("date"))
+
+        self.postings = {
+            field: {value: np.array(ids, dtype=np.int32) for value, ids in values.items()}
+            for field, values in postings.items()
+        }
+        self.date_order = np.argsort(dates, kind="stable").astype(np.int32)
+        self.sorted_dates = dates[self.date_order]
+        self._masks = LRUCache(256)
+
+    # Normalized filter dict, or None when nothing is filtered
+    @staticmethod
+    def normalize_filters(filters: dict | None) -> dict | None:
+        if not filters:
+            return None
+        normalized = {}
+        for name in FILTER_FIELDS:
+            values = filters.get(name)
+            if values:
+                normalized[name] = sorted({_normalize(v) for v in values})
+        for name in ("date_from", "date_to"):
+            if filters.get(name):
+                normalized[name] = str(filters[name])[:10]
+        return normalized or None
+
+    def _date_rows(self, date_from: str | None, date_to: str | None) -> np.ndarray:
+        lo = np.searchsorted(self.sorted_dates, max(_date_key(date_from), 1) if date_from else 1, side="left")
+        hi = np.searchsorted(self.sorted_dates, _date_key(date_to), side="right") if date_to else self.count
+        return self.date_order[lo:hi]
+
+    # Boolean mask of rows passing `filters`, or None when there are no filters
+    def mask(self, filters: dict | None) -> np.ndarray | None:
+        filters = self.normalize_filters(filters)
+        if filters is None:
+            return None
+
+        key = json.dumps(filters, sort_keys=True)
+        cached = self._masks.get(key)
+        if cached is not None:
+            return cached
+
+        mask = np.ones(self.count, dtype=bool)
+        for name, field in FILTER_FIELDS.items():
+            if name in filters:
+                allowed = np.zeros(self.count, dtype=bool)
+                for value in filters[name]:
+                    ids = self.postings[field].get(value)
+                    if ids is not None:
+                        allowed[ids] = True
+                mask &= allowed
+        if "date_from" in filters or "date_to" in filters:
+            allowed = np.zeros(self.count, dtype=bool)
+            allowed[self._date_rows(filters.get("date_from"), filters.get("date_to"))] = True
+            mask &= allowed
+
+        mask.flags.writeable = False
+        self._masks.put(key, mask)
+        return mask
@@ -1,8 +1,20 @@
+from datetime import date
 from pydantic import BaseModel
 
+# Optional restrictions on which chunks retrieval may consider. Values match the
+# chunk metadata case-insensitively; several values for one field are OR-ed.
+class RetrievalFilters(BaseModel):
+    courts: list[str] | None = None
+    sections: list[str] | None = None
+    procedures: list[str] | None = None
+    subjects: list[str] | None = None
+    date_from: date | None = None
+    date_to: date | None = None
+
 class MemoRequest(BaseModel):
     disputedDecision: str
     desiredOutcome: str
     criticalFacts: str
     applicableLaw: str
     recipients: str
+    filters: RetrievalFilters | None = None
@@ -0,0 +1,205 @@
+import json
+import os
+import numpy as np
+from app.vector_index import LocalVectorIndex
+
+# Compact copy of the flat index for the coarse pass of a two-stage search:
+#  - quantized.codes: int8 codes (count x dim) or sign bits (count x dim/8), memory-mapped
+#  - quantized.npz:   mean, optional PCA components, per-dimension int8 scale
+#  - quantized.json:  {"count", "dim", "kind", "reduced_dim", "corpus_version"}
+# Candidates found on the codes are rescored with the full-precision vectors.f32
+# rows, so only the shortlist touches the large matrix.
+QUANTIZED_CODES_FILE = "quantized.codes"
+QUANTIZED_PARAMS_FILE = "quantized.npz"
+QUANTIZED_MANIFEST_FILE = "quantized.json"
+QUANTIZATION_KINDS = ("int8", "binary")
+
+# Rows scored per block in the coarse pass, bounds the temporary float32 copy
+SCAN_BLOCK = 4096
+# Bits set in every byte value, for Hamming distances on numpy < 2.0
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+
+# Learns the (optional) PCA projection and the int8 scale from `vectors`.
+# PCA is fitted on at most `sample_size` rows.
+def fit_quantizer(vectors: np.ndarray, kind: str = "int8", reduced_dim: int | None = None,
+                  sample_size: int = 50000) -> dict:
+    if kind not in QUANTIZATION_KINDS:
+        raise ValueError(f"Unknown quantization kind: {kind}")
+    rng = np.random.default_rng(0)
+    sample_rows = np.sort(rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False))
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+    mean = sample.mean(axis=0)
+
+    components = None
+    if reduced_dim is not None and reduced_dim < vectors.shape[1]:
+        _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+        components = vt[:reduced_dim].astype(np.float32)
+
+    params = {"kind": kind, "mean": mean, "components": components, "scale": None}
+    if kind == "int8":
+        projected = _project(sample, params)
+        params["scale"] = (np.abs(projected).max(axis=0) / 127).clip(min=1e-12).astype(np.float32)
+    return params
+
+
+# Centered (and projected) vectors; the coarse scores rank rows by their dot
+# product with the query minus mean·query, which is the same for every row.
+def _project(vectors: np.ndarray, params: dict) -> np.ndarray:
+    centered = np.asarray(vectors, dtype=np.float32) - params["mean"]
+    if params["components"] is not None:
+        return centered @ params["components"].T
+    return centered
+
+
+def encode_vectors(vectors: np.ndarray, params: dict) -> np.ndarray:
+    projected = _project(vectors, params)
+    if params["kind"] == "int8":
+        return np.clip(np.rint(projected / params["scale"]), -127, 127).astype(np.int8)
+    return np.packbits(projected > 0, axis=1)
+
+
+# Higher is more similar. int8 codes are scored asymmetrically (float query
+# against integer codes); binary codes by negated Hamming distance.
+def coarse_scores(codes: np.ndarray, query: np.ndarray, params: dict) -> np.ndarray:
+    q = _project(query[None, :], params)[0]
+    scores = np.empty(len(codes), dtype=np.float32)
+
+    if params["kind"] == "int8":
+        q = q * params["scale"]
+        for start in range(0, len(codes), SCAN_BLOCK):
+            block = np.asarray(codes[start:start + SCAN_BLOCK], dtype=np.float32)
+            scores[start:start + len(block)] = block @ q
+    else:
+        q_bits = np.packbits(q > 0)
+        for start in range(0, len(codes), SCAN_BLOCK):
+            block = np.bitwise_xor(codes[start:start + SCAN_BLOCK], q_bits)
+            scores[start:start + len(block)] = -_hamming_weight(block)
+    return scores
+
+
+def _hamming_weight(bits: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[bits].sum(axis=1, dtype=np.int32)
+
+
+# Builds the quantized copy of the flat index in `index_dir`; `out_dir` defaults to it.
+def build_quantized_index(index_dir: str, kind: str = "int8", reduced_dim: int | None = None,
+                          out_dir: str | None = None) -> dict:
+    out_dir = out_dir or index_dir
+    os.makedirs(out_dir, exist_ok=True)
+    flat = LocalVectorIndex(index_dir)
+    if len(flat) == 0:
+        raise ValueError(f"Index at {index_dir} is empty")
+
+    params = fit_quantizer(flat.vectors, kind, reduced_dim)
+    codes = np.concatenate([
+        encode_vectors(flat.vectors[start:start + SCAN_BLOCK], params)
+        for start in range(0, len(flat), SCAN_BLOCK)
+    ])
+    codes.tofile(os.path.join(out_dir, QUANTIZED_CODES_FILE))
+
+    np.savez(
+        os.path.join(out_dir, QUANTIZED_PARAMS_FILE),
+        mean=params["mean"],
+        components=params["components"] if params["components"] is not None else np.zeros((0, 0), np.float32),
+        scale=params["scale"] if params["scale"] is not None else np.zeros(0, np.float32)
+    )
+    manifest = {
+        "count": len(flat),
+        "dim": flat.manifest["dim"],
+        "kind": kind,
+        "reduced_dim": int(params["components"].shape[0]) if params["components"] is not None else None,
+        "code_shape": list(codes.shape),
+        "corpus_version": flat.manifest.get("corpus_version"),
+    }
+    with open(os.path.join(out_dir, QUANTIZED_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    return {
+        "count": len(flat),
+        "code_bytes": int(codes.nbytes),
+        "float32_bytes": int(flat.vectors.nbytes),
+    }
+
+
+class QuantizedVectorIndex:
+    def __init__(self, index_dir: str, rescore_factor: int = 4, quantized_dir: str | None = None):
+        quantized_dir = quantized_dir or index_dir
+        self.flat = LocalVectorIndex(index_dir)
+        self.manifest = self.flat.manifest
+        self.rows = self.flat.rows
+
+        manifest_path = os.path.join(quantized_dir, QUANTIZED_MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise RuntimeError(f"No quantized index in {quantized_dir}; run _pipeline/5_build_quantized_index.py")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.quantized_manifest = json.load(f)
+        if self.quantized_manifest["count"] != len(self.flat) \
+                or self.quantized_manifest["corpus_version"] != self.manifest.get("corpus_version"):
+            raise RuntimeError(f"Quantized index in {quantized_dir} is stale; rebuild it with _pipeline/5_build_quantized_index.py")
+
+        stored = np.load(os.path.join(quantized_dir, QUANTIZED_PARAMS_FILE))
+        kind = self.quantized_manifest["kind"]
+        self.params = {
+            "kind": kind,
+            "mean": stored["mean"],
+            "components": stored["components"] if stored["components"].size else None,
+            "scale": stored["scale"] if stored["scale"].size else None,
+        }
+        self.codes = np.memmap(
+            os.path.join(quantized_dir, QUANTIZED_CODES_FILE),
+            dtype=np.int8 if kind == "int8" else np.uint8,
+            mode="r",
+            shape=tuple(self.quantized_manifest["code_shape"])
+        )
+        # Shortlist size is rescore_factor x match_count
+        self.rescore_factor = rescore_factor
+
+    def __len__(self):
+        return len(self.flat)
+
+    def get_vectors(self, ids: list[str]) -> list[np.ndarray | None]:
+        return self.flat.get_vectors(ids)
+
+    # Same contract as LocalVectorIndex.search; a larger `rescore_factor` trades
+    # latency for recall.
+    def search(self, vector: np.ndarray, match_count: int = 50, match_threshold: float = 0.7,
+               filters: dict | None = None) -> list[dict]:
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        # Only the codes of rows passing the filters are scanned
+        mask = self.flat.metadata.mask(filters) if filters else None
+        rows = None if mask is None else np.flatnonzero(mask)
+        codes = self.codes if rows is None else self.codes[rows]
+        if len(codes) == 0:
+            return []
+
+        scores = coarse_scores(codes, query, self.params)
+        shortlist = min(match_count * self.rescore_factor, len(scores))
+        candidates = np.sort(np.argpartition(-scores, shortlist - 1)[:shortlist])
+        if rows is not None:
+            candidates = rows[candidates]
+
+        # Exact rescoring on the shortlisted full-precision rows
+        exact = np.asarray(self.flat.vectors[candidates]) @ query
+        order = np.argsort(-exact)[:match_count]
+
+        results = []
+        for i in order:
+            similarity = float(exact[i])
+            if 1 - similarity >= match_threshold:
+                break
+            row = self.flat.rows[candidates[i]]
+            results.append({
+                "id": row["id"],
+                "ecli": row["ecli"],
+                "content": row["content"],
+                "metadata": row["metadata"],
+                "similarity": similarity,
+            })
+        return results
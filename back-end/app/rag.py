@@ -1,59 +1,132 @@
 import numpy as np
 import httpx
-import certifi
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic 
-from langchain_core.prompts import ChatPromptTemplate
 from dotenv import load_dotenv
-from supabase import create_client
+from supabase import create_client, acreate_client, AsyncClient
 import os
-import requests
+import json
+import time
+import asyncio
+import threading
+from uuid import UUID
 from collections import defaultdict
 from app.prompt import build_reviewer_prompt
+from app.llm import get_chat_model, MEMO_MODEL, MEMO_TEMPERATURE, MEMO_PROMPT, REVIEW_PROMPT
+from app.env import get_retrieval_backend, get_match_rpc, get_query_vector_encoding, get_vector_index_dir, get_ann_ef_search
+from app.env import get_quantized_rescore_factor, get_two_stage_rulings, get_hybrid_retrieval, get_rrf_k
+from app.env import get_embedding_cache_size, get_embedding_cache_path, get_embedding_cache_disk_size
+from app.env import get_chunk_embedding_cache_size, get_corpus_version_ttl, get_retrieval_cache_size
+from app.env import get_embedding_backend, get_embedding_url, get_embedding_device, get_embedding_max_batch, get_embedding_max_wait_ms, get_embedding_onnx_dir
+from app.env import get_deep_infra_timeout, get_deep_infra_deadline, get_deep_infra_max_retries, get_deep_infra_max_connections
+from app.transport import PooledTransport
+from app.cache import EmbeddingCache, LRUCache, RetrievalCache, normalize_text
+from app.vector_index import LocalVectorIndex
+from app.vector_codec import encode_vector, roundtrip_vector
+from app.sparse_index import SparseIndex, reciprocal_rank_fusion
+from app.metadata_index import MetadataIndex
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE = os.getenv("SUPABASE_SERVICE_ROLE")
 supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE)
-http_client = httpx.Client(verify=certifi.where())
+
+# The async Supabase client has to be created inside the running event loop
+_async_supabase = None
+
+async def get_async_supabase() -> AsyncClient:
+    global _async_supabase
+    if _async_supabase is None:
+        _async_supabase = await acreate_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE)
+    return _async_supabase
 
 DEEP_INFRA_API_TOKEN = os.getenv("DEEP_INFRA_API_TOKEN")
 
-DEEP_INFRA_URL = "https://api.deepinfra.com/v1/openai/embeddings"
+DEEP_INFRA_URL = get_embedding_url()
 DEEP_INFRA_HEADERS = {
     "Accept": "application/json",
     "Authorization": f"Bearer {DEEP_INFRA_API_TOKEN}",
     "Content-Type": "application/json",
 }
+# One pooled keep-alive transport for all embedding calls (sync and async)
+embedding_transport = PooledTransport(
+    timeout=get_deep_infra_timeout(),
+    deadline=get_deep_infra_deadline(),
+    max_retries=get_deep_infra_max_retries(),
+    max_connections=get_deep_infra_max_connections()
+)
+
+# Cosine distance cut-off and candidate count used before per-ECLI filtering
+MATCH_THRESHOLD = 0.7
+MATCH_COUNT = 50
+# Retrieval backends served from the index files in VECTOR_INDEX_DIR
+LOCAL_BACKENDS = ("local", "ann", "quantized", "two_stage")
+
+EMBEDDING_MODEL = "intfloat/multilingual-e5-large"
+QUERY_PREFIX = "query: "
+
+# In-process model for EMBEDDING_BACKEND=local, loaded at API startup or on first use
+_local_embedder = None
+_local_embedder_lock = threading.Lock()
+
+def get_local_embedder():
+    global _local_embedder
+    if _local_embedder is None:
+        with _local_embedder_lock:
+            if _local_embedder is None:
+                from app.embedders import LocalEmbedder
+                _local_embedder = LocalEmbedder(
+                    EMBEDDING_MODEL,
+                    device=get_embedding_device(),
+                    max_batch_size=get_embedding_max_batch(),
+                    max_wait_ms=get_embedding_max_wait_ms(),
+                    onnx_dir=get_embedding_onnx_dir()
+                )
+    return _local_embedder
+
+# Async callers load the model on a worker thread (the lock above makes
+# concurrent first requests wait for the one load), so the event loop keeps
+# serving other requests and streams while it loads
+async def aget_local_embedder():
+    if _local_embedder is not None:
+        return _local_embedder
+    return await asyncio.to_thread(get_local_embedder)
 
-def embed_query(text: str) -> np.ndarray:
-    payload = {
-        "input": f"query: {text}",
-        "model": "intfloat/multilingual-e5-large",
+# Micro-batching counters, or None until the local model has been loaded
+def local_embedder_stats() -> dict | None:
+    return _local_embedder.stats() if _local_embedder is not None else None
+
+# Query embeddings are cached in memory and (optionally) on disk, so identical
+# resubmitted forms skip the embedding call entirely.
+query_embedding_cache = EmbeddingCache(
+    max_entries=get_embedding_cache_size(),
+    disk_path=get_embedding_cache_path(),
+    max_disk_entries=get_embedding_cache_disk_size()
+)
+
+def _embedding_payload(inputs) -> dict:
+    return {
+        "input": inputs,
+        "model": EMBEDDING_MODEL,
         "encoding_format": "float"
     }
 
-    response = requests.post(DEEP_INFRA_URL, headers=DEEP_INFRA_HEADERS, json=payload)
+async def _apost_embeddings(payload: dict):
+    try:
+        return await embedding_transport.apost(DEEP_INFRA_URL, headers=DEEP_INFRA_HEADERS, json=payload)
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"Deep Infra embedding API unreachable: {str(e)}") from e
 
+def _parse_query_embedding(response) -> np.ndarray:
     if response.status_code != 200:
         raise RuntimeError(f"Deep Infra embedding API failed: {response.text}")
 
     try:
         data = response.json()
-        embedding = data["data"][0]["embedding"]
-        return np.array(embedding, dtype=np.float32)
+        return np.array(data["data"][0]["embedding"], dtype=np.float32)
     except (KeyError, IndexError, TypeError) as e:
         raise RuntimeError(f"Unexpected response structure: {response.text}") from e
-    
-def embed_batch(texts: list[str]) -> list[np.ndarray]:
-    payload = {
-        "input": [f"passage: {t}" for t in texts],
-        "model": "intfloat/multilingual-e5-large",
-        "encoding_format": "float"
-    }
 
-    response = requests.post(DEEP_INFRA_URL, headers=DEEP_INFRA_HEADERS, json=payload)
+def _parse_batch_embeddings(response) -> list[np.ndarray]:
     if response.status_code != 200:
         raise RuntimeError(f"Deep Infra embedding API failed: {response.text}")
     # All embeddings were L2-normalized to ensure consistent vector length across similarity metrics, enabling valid comparison between cosine similarity and dot-product scores.
@@ -71,82 +144,321 @@ def embed_batch(texts: list[str]) -> list[np.ndarray]:
 
     return normalized
 
-# Query Supabase for the most similar chunks and return structured entries.
-# Limits to `top_k` total, and `max_per_ecli` chunks per ECLI.
-def retrieve_chunks(vector: np.ndarray, top_k: int = 6, max_per_ecli: int = 2):
-    vector_str = f"[{', '.join(map(str, vector.tolist()))}]"
+async def aembed_query(text: str) -> np.ndarray:
+    # Whitespace variants share a cache entry; the model still sees the text as given
+    cache_key = EmbeddingCache.make_key(normalize_text(text), EMBEDDING_MODEL, QUERY_PREFIX)
+    cached = query_embedding_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if get_embedding_backend() == "local":
+        embedder = await aget_local_embedder()
+        embedding = (await embedder.aembed([f"{QUERY_PREFIX}{text}"]))[0]
+    else:
+        payload = _embedding_payload(f"{QUERY_PREFIX}{text}")
+        response = await _apost_embeddings(payload)
+        embedding = _parse_query_embedding(response)
+
+    query_embedding_cache.put(cache_key, embedding)
+    return embedding
+
+async def aembed_batch(texts: list[str]) -> list[np.ndarray]:
+    if get_embedding_backend() == "local":
+        embedder = await aget_local_embedder()
+        return await embedder.aembed([f"passage: {t}" for t in texts])
+    payload = _embedding_payload([f"passage: {t}" for t in texts])
+    response = await _apost_embeddings(payload)
+    return _parse_batch_embeddings(response)
 
+# Stored corpus vectors by chunk id, so evaluation does not re-embed chunks
+chunk_embedding_cache = LRUCache(get_chunk_embedding_cache_size())
+
+def _is_uuid(value) -> bool:
     try:
-        response = supabase.rpc("match_case_chunks", {
-            "query_embedding": vector_str,
-            "match_threshold": 0.7,
-            # We fetch more so we can filter
-            "match_count": 50  
-        }).execute()
-
-        raw_chunks = response.data
-        if not raw_chunks:
-            return []
-
-        grouped_by_ecli = defaultdict(list)
-
-        for c in raw_chunks:
-            meta = c.get("metadata", {})
-            ecli = c.get("ecli") or meta.get("ecli") or meta.get("title", "").split()[0] or "UNKNOWN"
-            chunk_entry = {
-                "id": c.get("id", "UNKNOWN"),
-                "chunk_index": meta.get("chunk_index", -1),
-                "sub_chunk_index": meta.get("sub_chunk_index", 0),
-                "ecli": ecli,
-                "text": c.get("content", ""),
-                "similarity": round(c.get("similarity", 0), 4),
-                "metadata": meta
-            }
-            grouped_by_ecli[ecli].append(chunk_entry)
-
-        # Flatten, limiting to max_per_ecli per ECLI
-        flattened = []
-        for chunks in grouped_by_ecli.values():
-            flattened.extend(chunks[:max_per_ecli])
-
-        flattened.sort(key=lambda x: x["similarity"], reverse=True)
-
-        return flattened[:top_k]
+        UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+# pgvector columns come back from PostgREST as "[0.1,0.2,...]" strings
+def _parse_pgvector(value) -> np.ndarray:
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.array(value, dtype=np.float32)
+
+# Splits `ids` into vectors already in memory and ids still to be looked up
+def _cached_chunk_embeddings(ids: list[str]) -> tuple[dict, list[str]]:
+    found = {}
+    missing = []
+    for chunk_id in dict.fromkeys(ids):
+        vector = chunk_embedding_cache.get(chunk_id)
+        if vector is not None:
+            found[chunk_id] = vector
+        elif _is_uuid(chunk_id):
+            missing.append(chunk_id)
+    return found, missing
+
+def _store_chunk_embeddings(found: dict, stored) -> None:
+    for chunk_id, vector in stored:
+        if vector is None:
+            continue
+        chunk_embedding_cache.put(chunk_id, vector)
+        found[chunk_id] = vector
+
+def _parse_stored_embeddings(rows: list[dict]) -> list[tuple[str, np.ndarray]]:
+    return [
+        (row["id"], _parse_pgvector(row["embedding"]))
+        for row in rows
+        if row.get("embedding") is not None
+    ]
+
+# Returns the embedding stored at ingestion time for each chunk id (None when unknown).
+# Looks in the in-memory cache first, then the local index or case_chunks.embedding.
+async def afetch_chunk_embeddings(ids: list[str]) -> list[np.ndarray | None]:
+    found, missing = _cached_chunk_embeddings(ids)
+
+    if missing:
+        if get_retrieval_backend() in LOCAL_BACKENDS:
+            index = await aget_local_index()
+            stored = zip(missing, index.get_vectors(missing))
+        else:
+            try:
+                client = await get_async_supabase()
+                response = await client.table("case_chunks") \
+                    .select("id, embedding") \
+                    .in_("id", missing) \
+                    .execute()
+            except Exception as e:
+                raise RuntimeError(f"Fetching stored chunk embeddings failed: {str(e)}")
+            stored = _parse_stored_embeddings(response.data)
+        _store_chunk_embeddings(found, stored)
+
+    return [found.get(chunk_id) for chunk_id in ids]
+
+# Local index ("local" = flat memory-mapped scan, "ann" = HNSW graph, "quantized" =
+# compact codes with exact rescoring, "two_stage" = rulings first, then their
+# chunks), opened at API startup (load_retrieval_indexes) or on first use and
+# shared by all requests in this worker
+_local_index = None
+_local_index_lock = threading.Lock()
+
+def get_local_index():
+    global _local_index
+    if _local_index is not None:
+        return _local_index
+    with _local_index_lock:
+        if _local_index is not None:
+            return _local_index
+        if get_retrieval_backend() == "ann":
+            from app.ann_index import AnnVectorIndex
+            _local_index = AnnVectorIndex(get_vector_index_dir(), ef_search=get_ann_ef_search())
+        elif get_retrieval_backend() == "quantized":
+            from app.quantized_index import QuantizedVectorIndex
+            _local_index = QuantizedVectorIndex(get_vector_index_dir(), rescore_factor=get_quantized_rescore_factor())
+        elif get_retrieval_backend() == "two_stage":
+            from app.two_stage_index import TwoStageVectorIndex
+            _local_index = TwoStageVectorIndex(get_vector_index_dir(), candidate_rulings=get_two_stage_rulings())
+        else:
+            _local_index = LocalVectorIndex(get_vector_index_dir())
+        return _local_index
+
+# Opening an index parses its files; async callers do that on a worker thread
+async def aget_local_index():
+    if _local_index is not None:
+        return _local_index
+    return await asyncio.to_thread(get_local_index)
+
+# Corpus version the caches are tagged with. The local backends report the version
+# stamped into the loaded index; Supabase is asked for the newest corpus_versions
+# row at most once every CORPUS_VERSION_TTL seconds.
+UNVERSIONED = "unversioned"
+_corpus_version = {"value": None, "checked_at": 0.0}
 
+def _corpus_version_is_fresh() -> bool:
+    return _corpus_version["value"] is not None \
+        and time.monotonic() - _corpus_version["checked_at"] < get_corpus_version_ttl()
+
+def _update_corpus_version(rows: list[dict] | None) -> str:
+    if rows:
+        _corpus_version["value"] = rows[0]["version"]
+    elif _corpus_version["value"] is None:
+        _corpus_version["value"] = UNVERSIONED
+    _corpus_version["checked_at"] = time.monotonic()
+    return _corpus_version["value"]
+
+async def aget_corpus_version() -> str:
+    if get_retrieval_backend() in LOCAL_BACKENDS:
+        return (await aget_local_index()).manifest.get("corpus_version", UNVERSIONED)
+    if _corpus_version_is_fresh():
+        return _corpus_version["value"]
+
+    try:
+        client = await get_async_supabase()
+        response = await client.table("corpus_versions") \
+            .select("version") \
+            .order("created_at", desc=True) \
+            .limit(1) \
+            .execute()
+        return _update_corpus_version(response.data)
+    except Exception:
+        return _update_corpus_version(None)
+
+# Keeps rows in their (similarity-descending) order, at most `max_per_ecli`
+# per ECLI, and returns the first `top_k` as structured entries.
+def select_chunks(raw_chunks: list[dict], top_k: int, max_per_ecli: int) -> list[dict]:
+    per_ecli = defaultdict(int)
+    selected = []
+
+    for c in raw_chunks:
+        meta = c.get("metadata", {})
+        ecli = c.get("ecli") or meta.get("ecli") or meta.get("title", "").split()[0] or "UNKNOWN"
+        if per_ecli[ecli] >= max_per_ecli:
+            continue
+        per_ecli[ecli] += 1
+
+        selected.append({
+            "id": c.get("id", "UNKNOWN"),
+            "chunk_index": meta.get("chunk_index", -1),
+            "sub_chunk_index": meta.get("sub_chunk_index", 0),
+            "ecli": ecli,
+            "text": c.get("content", ""),
+            "similarity": round(c.get("similarity", 0), 4),
+            "metadata": meta
+        })
+        if len(selected) == top_k:
+            break
+
+    return selected
+
+# Base64-packed query vectors need the packed RPC, which decodes them in SQL;
+# metadata filters need one of the RPCs from supabase_match_case_chunks_filtered.sql
+def _match_rpc(filters: dict | None) -> str:
+    if get_query_vector_encoding() != "text":
+        return "match_case_chunks_packed"
+    if filters:
+        return "match_case_chunks_filtered"
+    return get_match_rpc()
+
+def _match_params(rpc: str, vector: np.ndarray, top_k: int, max_per_ecli: int, filters: dict | None) -> dict:
+    params = {
+        "match_threshold": MATCH_THRESHOLD,
+        # We fetch more so we can filter
+        "match_count": MATCH_COUNT
+    }
+    if rpc == "match_case_chunks_packed":
+        encoding = get_query_vector_encoding()
+        params["query_vector"] = encode_vector(vector, encoding)
+        params["vector_encoding"] = encoding
+    else:
+        params["query_embedding"] = encode_vector(vector, "text")
+    if rpc in ("match_case_chunks_v2", "match_case_chunks_packed", "match_case_chunks_filtered"):
+        # The per-ECLI cap and the top_k cut happen in SQL
+        params["top_k"] = top_k
+        params["max_per_ecli"] = max_per_ecli
+    for name, value in (filters or {}).items():
+        params[f"filter_{name}"] = value
+    return params
+
+# Local search with the query exactly as the RPC would receive it
+def _local_search(vector: np.ndarray, filters: dict | None) -> list[dict]:
+    vector = roundtrip_vector(vector, get_query_vector_encoding())
+    return get_local_index().search(vector, MATCH_COUNT, MATCH_THRESHOLD, filters)
+
+# Lazily opened BM25 index for hybrid retrieval; shares the rows of the local
+# index when one is loaded
+_sparse_index = None
+_sparse_index_lock = threading.Lock()
+
+def get_sparse_index():
+    global _sparse_index
+    if _sparse_index is not None:
+        return _sparse_index
+    with _sparse_index_lock:
+        if _sparse_index is None:
+            rows = get_local_index().rows if get_retrieval_backend() in LOCAL_BACKENDS else None
+            _sparse_index = SparseIndex(get_vector_index_dir(), rows=rows)
+        return _sparse_index
+
+def _sparse_search(query_text: str, filters: dict | None) -> list[dict]:
+    return get_sparse_index().search(query_text, MATCH_COUNT, filters)
+
+# Opens the indexes the configured retrieval needs and builds their metadata
+# filters, so the first requests do not pay for it. Blocking; the API runs it on
+# a worker thread at startup.
+def load_retrieval_indexes():
+    if get_retrieval_backend() in LOCAL_BACKENDS:
+        index = get_local_index()
+        getattr(index, "flat", index).metadata
+    if get_hybrid_retrieval():
+        get_sparse_index().metadata
+
+# Top-k results per query vector, invalidated when the corpus version changes
+retrieval_cache = RetrievalCache(get_retrieval_cache_size())
+
+# Raw candidates from the dense backend, best first. `top_k` only matters for
+# the RPCs that apply the per-ECLI cap in SQL.
+async def _adense_search(vector: np.ndarray, top_k: int, max_per_ecli: int, filters: dict | None) -> list[dict]:
+    if get_retrieval_backend() == "local":
+        await aget_local_index()
+        return _local_search(vector, filters)
+    # Graph walks, code scans with rescoring and the ruling stage run on a worker thread
+    if get_retrieval_backend() in LOCAL_BACKENDS:
+        return await asyncio.to_thread(_local_search, vector, filters)
+
+    rpc = _match_rpc(filters)
+    try:
+        client = await get_async_supabase()
+        response = await client.rpc(rpc, _match_params(rpc, vector, top_k, max_per_ecli, filters)).execute()
+        return response.data or []
     except Exception as e:
-        raise RuntimeError(f"Supabase RPC match_case_chunks failed: {str(e)}")
+        raise RuntimeError(f"Supabase RPC {rpc} failed: {str(e)}")
 
-def generate_memo(full_prompt: str) -> str:
-    chat = ChatOpenAI(
-        model="gpt-4.1",
-        temperature=0.2,
-        http_client=http_client
+async def _asearch_chunks(vector: np.ndarray, top_k: int, max_per_ecli: int, query_text: str | None,
+                          filters: dict | None):
+    if query_text is None:
+        return select_chunks(await _adense_search(vector, top_k, max_per_ecli, filters), top_k, max_per_ecli)
+
+    dense, sparse = await asyncio.gather(
+        _adense_search(vector, MATCH_COUNT, max_per_ecli, filters),
+        asyncio.to_thread(_sparse_search, query_text, filters)
     )
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "Je bent een juridisch assistent gespecialiseerd in Nederlandse sociale zekerheidszaken. Je schrijft juridisch correcte en duidelijke memo's gebaseerd op gerechtelijke uitspraken."),
-        ("user", "{memo_input}")
-    ])
-    formatted = prompt.invoke({"memo_input": full_prompt})
-    return chat.invoke(formatted).content
-
-def refine_memo(draft: str, chunks: list[dict], temperature: float = 0.2, model_name: str = "gpt-4.1") -> str:
-    if model_name == "claude-4-sonnet":
-        chat = ChatAnthropic(
-            model=model_name,
-            temperature=temperature,
-            anthropic_api_key=os.environ["ANTHROPIC_API_KEY"]
-        )
-    else:
-        chat = ChatOpenAI(
-            model=model_name,
-            temperature=temperature,
-            http_client=http_client
-        )
+    fused = reciprocal_rank_fusion([dense, sparse], get_rrf_k())
+    return select_chunks(fused, top_k, max_per_ecli)
+
+# Query the configured backend for the most similar chunks and return structured entries.
+# Limits to `top_k` total, and `max_per_ecli` chunks per ECLI. With HYBRID_RETRIEVAL
+# and a `query_text`, dense and BM25 results are fused by reciprocal rank; chunks
+# found only by BM25 carry a similarity of 0. Optional metadata `filters`
+# (courts, sections, procedures, subjects, date_from, date_to) restrict the search
+# itself, not its results. Repeated queries against the same corpus version are
+# answered from retrieval_cache.
+async def aretrieve_chunks(vector: np.ndarray, top_k: int = 6, max_per_ecli: int = 2, query_text: str | None = None,
+                           filters: dict | None = None):
+    query_text = query_text if get_hybrid_retrieval() else None
+    filters = MetadataIndex.normalize_filters(filters)
+    corpus_version = await aget_corpus_version()
+    cache_key = RetrievalCache.make_key(vector, top_k, max_per_ecli, MATCH_THRESHOLD, query_text, filters)
+    chunks = retrieval_cache.get(cache_key, corpus_version)
+    if chunks is not None:
+        return chunks
+
+    start = time.perf_counter()
+    chunks = await _asearch_chunks(vector, top_k, max_per_ecli, query_text, filters)
+    retrieval_cache.put(cache_key, chunks, time.perf_counter() - start, corpus_version)
+    return chunks
+
+async def agenerate_memo(full_prompt: str) -> str:
+    chat = get_chat_model(MEMO_MODEL, MEMO_TEMPERATURE)
+    return (await chat.ainvoke(MEMO_PROMPT.invoke({"memo_input": full_prompt}))).content
+
+# Yields memo text as it arrives from the model, for the streaming endpoint
+async def astream_memo(full_prompt: str):
+    chat = get_chat_model(MEMO_MODEL, MEMO_TEMPERATURE)
+    async for chunk in chat.astream(MEMO_PROMPT.invoke({"memo_input": full_prompt})):
+        if chunk.content:
+            yield chunk.content
 
+async def arefine_memo(draft: str, chunks: list[dict], temperature: float = 0.2, model_name: str = "gpt-4.1") -> str:
+    chat = get_chat_model(model_name, temperature)
     full_prompt = build_reviewer_prompt(draft=draft, chunks=chunks)
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "Je bent een juridisch assistent gespecialiseerd in Nederlandse sociale zekerheidszaken. Je controleert of een memo juridisch correct en goed onderbouwd is."),
-        ("user", "{review_input}")
-    ])
-    formatted = prompt.invoke({"review_input": full_prompt})
-    return chat.invoke(formatted).content
\ No newline at end of file
+    return (await chat.ainvoke(REVIEW_PROMPT.invoke({"review_input": full_prompt}))).content
@@ -0,0 +1,193 @@
+import json
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+from nltk.stem.snowball import DutchStemmer
+from app.metadata_index import MetadataIndex
+from app.vector_index import ChunkRows
+
+# BM25 inverted index over the rows of the local vector index (same row order,
+# so a posting's doc number is a row in chunks.jsonl / vectors.f32):
+#  - bm25_vocab.json:    terms, term i owns postings offsets[i]:offsets[i + 1]
+#  - bm25_offsets.i64:   posting list boundaries (n_terms + 1)
+#  - bm25_docs.i32:      row numbers, ascending within each term
+#  - bm25_weights.f32:   precomputed BM25 impact of the term in that row
+#  - bm25.json:          {"count", "n_terms", "n_postings", "k1", "b", "avgdl", "corpus_version"}
+# Posting arrays are memory-mapped; a query only touches the lists of its terms.
+SPARSE_VOCAB_FILE = "bm25_vocab.json"
+SPARSE_OFFSETS_FILE = "bm25_offsets.i64"
+SPARSE_DOCS_FILE = "bm25_docs.i32"
+SPARSE_WEIGHTS_FILE = "bm25_weights.f32"
+SPARSE_MANIFEST_FILE = "bm25.json"
+
+# ECLIs and article references ("7:658", "6:162a", "8.2") stay whole tokens;
+# everything else is split into words.
+_TOKEN_RE = re.compile(r"ecli:[a-z]{2}:[a-z0-9]+:\d{4}:[a-z0-9.]*[a-z0-9]|\d+[:.]\d+[a-z]?|\w+")
+
+DUTCH_STOPWORDS = frozenset("""
+aan al alles als altijd andere ben bij daar dan dat de der deze die dit doch doen door dus
+een eens en er ge geen geweest haar had heb hebben heeft hem het hier hij hoe hun iemand iets
+ik in is ja je kan kon kunnen maar me meer men met mij mijn moet na naar niet niets nog nu of
+om omdat onder ons ook op over reeds te tegen toch toen tot u uit uw van veel voor want waren
+was wat werd wezen wie wil worden wordt zal ze zelf zich zij zijn zo zonder zou
+""".split())
+
+_stemmer = DutchStemmer()
+
+
+@lru_cache(maxsize=200_000)
+def _stem(token: str) -> str:
+    # Identifiers and numbers are matched literally
+    if not token.isalpha():
+        return token
+    return _stemmer.stem(token)
+
+
+# Lowercases, tokenizes, drops Dutch stopwords and stems the remaining words
+def analyze(text: str) -> list[str]:
+    return [
+        _stem(token)
+        for token in _TOKEN_RE.findall(text.lower())
+        if token not in DUTCH_STOPWORDS and (len(token) > 1 or token.isdigit())
+    ]
+
+
+def _document_text(row: dict) -> str:
+    return f"{row.get('ecli', '')} {row.get('content', '')}"
+
+
+# Builds the BM25 index for the rows of the vector index in `index_dir`
+def build_sparse_index(index_dir: str, k1: float = 1.2, b: float = 0.75) -> dict:
+    with open(os.path.join(index_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    rows = ChunkRows(index_dir, manifest["count"])
+
+    postings = {}
+    lengths = np.zeros(len(rows), dtype=np.float32)
+    for doc, row in enumerate(rows):
+        terms = analyze(_document_text(row))
+        lengths[doc] = len(terms)
+        for term, tf in Counter(terms).items():
+            postings.setdefault(term, []).append((doc, tf))
+
+    avgdl = float(lengths.mean()) if len(rows) else 0.0
+    vocab = sorted(postings)
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    docs, weights = [], []
+    for i, term in enumerate(vocab):
+        term_docs = np.array([doc for doc, _ in postings[term]], dtype=np.int32)
+        tf = np.array([tf for _, tf in postings[term]], dtype=np.float32)
+        df = len(term_docs)
+        idf = np.log(1 + (len(rows) - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * lengths[term_docs] / (avgdl or 1.0))
+        docs.append(term_docs)
+        weights.append((idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+        offsets[i + 1] = offsets[i] + df
+
+    docs = np.concatenate(docs) if docs else np.zeros(0, dtype=np.int32)
+    weights = np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32)
+    offsets.astype("<i8").tofile(os.path.join(index_dir, SPARSE_OFFSETS_FILE))
+    docs.astype("<i4").tofile(os.path.join(index_dir, SPARSE_DOCS_FILE))
+    weights.astype("<f4").tofile(os.path.join(index_dir, SPARSE_WEIGHTS_FILE))
+    with open(os.path.join(index_dir, SPARSE_VOCAB_FILE), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+
+    sparse_manifest = {
+        "count": len(rows),
+        "n_terms": len(vocab),
+        "n_postings": int(len(docs)),
+        "k1": k1,
+        "b": b,
+        "avgdl": avgdl,
+        "corpus_version": manifest.get("corpus_version"),
+    }
+    with open(os.path.join(index_dir, SPARSE_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(sparse_manifest, f, indent=2)
+
+    return {
+        **sparse_manifest,
+        "bytes": int(offsets.nbytes + docs.nbytes + weights.nbytes),
+    }
+
+
+class SparseIndex:
+    # `rows` can be shared with an already loaded LocalVectorIndex
+    def __init__(self, index_dir: str, rows: ChunkRows | None = None):
+        manifest_path = os.path.join(index_dir, SPARSE_MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise RuntimeError(f"No BM25 index in {index_dir}; run _pipeline/6_build_sparse_index.py")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(index_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            if json.load(f).get("corpus_version") != self.manifest["corpus_version"]:
+                raise RuntimeError(f"BM25 index in {index_dir} is stale; rebuild it with _pipeline/6_build_sparse_index.py")
+
+        with open(os.path.join(index_dir, SPARSE_VOCAB_FILE), "r", encoding="utf-8") as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        self.offsets = self._map(index_dir, SPARSE_OFFSETS_FILE, "<i8", self.manifest["n_terms"] + 1)
+        self.docs = self._map(index_dir, SPARSE_DOCS_FILE, "<i4", self.manifest["n_postings"])
+        self.weights = self._map(index_dir, SPARSE_WEIGHTS_FILE, "<f4", self.manifest["n_postings"])
+
+        self.rows = rows if rows is not None else ChunkRows(index_dir, self.manifest["count"])
+        self._metadata = None
+
+    # Built on the first filtered query
+    @property
+    def metadata(self) -> MetadataIndex:
+        if self._metadata is None:
+            self._metadata = MetadataIndex(self.rows)
+        return self._metadata
+
+    @staticmethod
+    def _map(index_dir: str, name: str, dtype: str, length: int) -> np.ndarray:
+        if length == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(os.path.join(index_dir, name), dtype=dtype, mode="r", shape=(length,))
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Top `match_count` rows by BM25 score, as {"id", "ecli", "content", "metadata", "score"}.
+    # Rows failing the metadata `filters` score 0 and are never returned.
+    def search(self, query_text: str, match_count: int = 50, filters: dict | None = None) -> list[dict]:
+        term_ids = [self.term_ids[t] for t in set(analyze(query_text)) if t in self.term_ids]
+        if not term_ids:
+            return []
+
+        docs = np.concatenate([self.docs[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        weights = np.concatenate([self.weights[self.offsets[t]:self.offsets[t + 1]] for t in term_ids])
+        scores = np.bincount(docs, weights=weights, minlength=len(self.rows))
+        mask = self.metadata.mask(filters) if filters else None
+        if mask is not None:
+            scores[~mask] = 0
+
+        # Every impact is positive, so rows without a query term score exactly 0
+        k = min(match_count, int(np.count_nonzero(scores)))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            row = self.rows[i]
+            results.append({
+                "id": row["id"],
+                "ecli": row["ecli"],
+                "content": row["content"],
+                "metadata": row["metadata"],
+                "score": float(scores[i]),
+            })
+        return results
+
+
+# Reciprocal-rank fusion of ranked result lists (each best-first, rows with an "id").
+# Rows keep the fields of their first occurrence, so dense similarity survives.
+def reciprocal_rank_fusion(rankings: list[list[dict]], k: int = 60) -> list[dict]:
+    fused = {}
+    rows = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[row["id"]] = fused.get(row["id"], 0.0) + 1.0 / (k + rank + 1)
+            rows.setdefault(row["id"], row)
+    return [rows[i] for i in sorted(fused, key=fused.get, reverse=True)]
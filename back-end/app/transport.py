@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import certifi
+import httpx
+
+# Responses worth retrying: rate limiting and transient upstream failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+# Keep-alive, HTTP/2 connection pool for one upstream API, shared by the sync and
+# async code paths. Every call gets an overall deadline; attempts that hit a
+# retryable status or a transport error are retried with full-jitter
+# exponential backoff (or the server's Retry-After) while the deadline allows.
+class PooledTransport:
+    def __init__(
+        self,
+        timeout: float = 30.0,
+        deadline: float = 60.0,
+        max_retries: int = 3,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        backoff_base: float = 0.25,
+        backoff_max: float = 4.0,
+        http2: bool = True
+    ):
+        # A hung attempt times out after `timeout`; with a deadline no longer than
+        # that, the first attempt could use it all and nothing would be retried
+        if max_retries > 0 and timeout >= deadline:
+            logger.warning(
+                "Per-attempt timeout (%ss) is not shorter than the deadline (%ss); using %ss so retries fit",
+                timeout, deadline, deadline / 2
+            )
+            timeout = deadline / 2
+        self.timeout = timeout
+        self.connect_timeout = min(timeout, 10.0)
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=60.0
+        )
+        client_timeout = httpx.Timeout(timeout, connect=self.connect_timeout)
+        self.client = httpx.Client(http2=http2, verify=certifi.where(), limits=limits, timeout=client_timeout)
+        self.async_client = httpx.AsyncClient(http2=http2, verify=certifi.where(), limits=limits, timeout=client_timeout)
+
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "attempts": 0,
+            "retries": 0,
+            "failures": 0,
+            "connections_opened": 0,
+            "tls_handshakes": 0,
+            "connect_seconds": 0.0,
+            "tls_seconds": 0.0,
+            "request_seconds": 0.0,
+        }
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._counters[key] += value
+
+    # httpcore reports "<event>.started" / "<event>.complete" pairs per attempt;
+    # new TCP connections and TLS handshakes only show up when the pool had no
+    # idle connection to reuse.
+    def _record_trace(self, name: str, started: dict):
+        event, _, phase = name.rpartition(".")
+        if phase == "started":
+            started[event] = time.perf_counter()
+        elif phase == "complete" and event in started:
+            elapsed = time.perf_counter() - started.pop(event)
+            if event == "connection.connect_tcp":
+                self._count(connections_opened=1, connect_seconds=elapsed)
+            elif event == "connection.start_tls":
+                self._count(tls_handshakes=1, tls_seconds=elapsed)
+
+    def _backoff(self, attempt: int, response: httpx.Response | None) -> float:
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return float(response.headers["Retry-After"])
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    # Per-attempt timeout, cut short only when the deadline is closer
+    def _attempt_timeout(self, deadline_at: float) -> httpx.Timeout:
+        remaining = max(deadline_at - time.monotonic(), 0.0)
+        return httpx.Timeout(min(self.timeout, remaining), connect=min(self.connect_timeout, remaining))
+
+    def post(self, url: str, headers: dict, json: dict) -> httpx.Response:
+        started = {}
+        trace = lambda name, info: self._record_trace(name, started)
+        deadline_at = time.monotonic() + self.deadline
+        start = time.perf_counter()
+        self._count(requests=1)
+
+        attempt = 0
+        while True:
+            response, error = None, None
+            self._count(attempts=1)
+            try:
+                response = self.client.post(
+                    url, headers=headers, json=json,
+                    timeout=self._attempt_timeout(deadline_at), extensions={"trace": trace}
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    self._count(request_seconds=time.perf_counter() - start)
+                    return response
+            except httpx.TransportError as e:
+                error = e
+
+            wait = self._backoff(attempt, response)
+            if attempt >= self.max_retries or time.monotonic() + wait >= deadline_at:
+                self._count(failures=1, request_seconds=time.perf_counter() - start)
+                if error is not None:
+                    raise error
+                return response
+
+            attempt += 1
+            self._count(retries=1)
+            time.sleep(wait)
+
+    async def apost(self, url: str, headers: dict, json: dict) -> httpx.Response:
+        started = {}
+        async def trace(name, info):
+            self._record_trace(name, started)
+        deadline_at = time.monotonic() + self.deadline
+        start = time.perf_counter()
+        self._count(requests=1)
+
+        attempt = 0
+        while True:
+            response, error = None, None
+            self._count(attempts=1)
+            try:
+                response = await self.async_client.post(
+                    url, headers=headers, json=json,
+                    timeout=self._attempt_timeout(deadline_at), extensions={"trace": trace}
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    self._count(request_seconds=time.perf_counter() - start)
+                    return response
+            except httpx.TransportError as e:
+                error = e
+
+            wait = self._backoff(attempt, response)
+            if attempt >= self.max_retries or time.monotonic() + wait >= deadline_at:
+                self._count(failures=1, request_seconds=time.perf_counter() - start)
+                if error is not None:
+                    raise error
+                return response
+
+            attempt += 1
+            self._count(retries=1)
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self._counters)
+        return {
+            "requests": c["requests"],
+            "attempts": c["attempts"],
+            "retries": c["retries"],
+            "failures": c["failures"],
+            "connections_opened": c["connections_opened"],
+            "tls_handshakes": c["tls_handshakes"],
+            # Share of attempts served on an already open connection
+            "connection_reuse_ratio": 1 - c["connections_opened"] / c["attempts"] if c["attempts"] else 0.0,
+            "avg_connect_ms": 1000 * c["connect_seconds"] / c["connections_opened"] if c["connections_opened"] else 0.0,
+            "avg_tls_handshake_ms": 1000 * c["tls_seconds"] / c["tls_handshakes"] if c["tls_handshakes"] else 0.0,
+            "handshake_seconds_total": c["connect_seconds"] + c["tls_seconds"],
+            "avg_request_ms": 1000 * c["request_seconds"] / c["requests"] if c["requests"] else 0.0,
+        }
@@ -0,0 +1,157 @@
+import json
+import os
+import numpy as np
+from app.vector_index import LocalVectorIndex
+
+# Per-ruling layer on top of the flat index for coarse-to-fine search:
+#  - rulings.f32:         one vector per ruling (count x dim): its ABSTRACT chunk,
+#                         or the normalized centroid of its chunks when it has none
+#  - rulings_offsets.i64: ruling i owns rulings_rows[offsets[i]:offsets[i + 1]]
+#  - rulings_rows.i32:    flat-index rows searched in the second stage
+#  - rulings.json:        {"count", "dim", "n_rows", "with_abstract", "sections", "corpus_version"}
+# Stage one scores rulings instead of chunks; stage two scores only the chunks
+# of the best rulings.
+RULINGS_VECTORS_FILE = "rulings.f32"
+RULINGS_OFFSETS_FILE = "rulings_offsets.i64"
+RULINGS_ROWS_FILE = "rulings_rows.i32"
+RULINGS_MANIFEST_FILE = "rulings.json"
+
+# Sections searched in the second stage. Rulings with none of these fall back
+# to all of their non-abstract chunks so they stay retrievable.
+STAGE2_SECTIONS = ("OVERWEGINGEN", "BESLISSING")
+
+
+def _is_abstract(row: dict) -> bool:
+    meta = row.get("metadata") or {}
+    return meta.get("section") == "ABSTRACT" or meta.get("chunk_index") == -1
+
+
+def build_two_stage_index(index_dir: str, sections: tuple = STAGE2_SECTIONS) -> dict:
+    flat = LocalVectorIndex(index_dir)
+    sections = {s.upper() for s in sections}
+
+    # One pass over the rows: (row, is abstract, section) per ECLI
+    by_ecli = {}
+    for i, row in enumerate(flat.rows):
+        section = ((row.get("metadata") or {}).get("section") or "").upper()
+        by_ecli.setdefault(row["ecli"], []).append((i, _is_abstract(row), section))
+
+    vectors, offsets, stage2_rows = [], [0], []
+    with_abstract = 0
+    for ecli, entries in by_ecli.items():
+        rows = [i for i, _, _ in entries]
+        abstract = [i for i, is_abstract, _ in entries if is_abstract]
+        body = [i for i, is_abstract, _ in entries if not is_abstract]
+        selected = [i for i, is_abstract, section in entries if not is_abstract and section in sections] or body
+        if not selected:
+            continue
+
+        if abstract:
+            vector = np.asarray(flat.vectors[abstract[0]], dtype=np.float32)
+            with_abstract += 1
+        else:
+            vector = np.asarray(flat.vectors[rows], dtype=np.float32).mean(axis=0)
+            vector /= np.linalg.norm(vector) or 1.0
+        vectors.append(vector)
+        stage2_rows.extend(selected)
+        offsets.append(len(stage2_rows))
+
+    matrix = np.ascontiguousarray(vectors, dtype="<f4").reshape(len(vectors), flat.manifest["dim"])
+    matrix.tofile(os.path.join(index_dir, RULINGS_VECTORS_FILE))
+    np.asarray(offsets, dtype="<i8").tofile(os.path.join(index_dir, RULINGS_OFFSETS_FILE))
+    np.asarray(stage2_rows, dtype="<i4").tofile(os.path.join(index_dir, RULINGS_ROWS_FILE))
+
+    manifest = {
+        "count": len(vectors),
+        "dim": flat.manifest["dim"],
+        "n_rows": len(stage2_rows),
+        "with_abstract": with_abstract,
+        "sections": sorted(sections),
+        "corpus_version": flat.manifest.get("corpus_version"),
+    }
+    with open(os.path.join(index_dir, RULINGS_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class TwoStageVectorIndex:
+    def __init__(self, index_dir: str, candidate_rulings: int = 20):
+        self.flat = LocalVectorIndex(index_dir)
+        self.manifest = self.flat.manifest
+        self.rows = self.flat.rows
+
+        manifest_path = os.path.join(index_dir, RULINGS_MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise RuntimeError(f"No ruling index in {index_dir}; run _pipeline/7_build_ruling_index.py")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.rulings_manifest = json.load(f)
+        if self.rulings_manifest["corpus_version"] != self.manifest.get("corpus_version"):
+            raise RuntimeError(f"Ruling index in {index_dir} is stale; rebuild it with _pipeline/7_build_ruling_index.py")
+
+        count, dim = self.rulings_manifest["count"], self.rulings_manifest["dim"]
+        self.ruling_vectors = np.memmap(
+            os.path.join(index_dir, RULINGS_VECTORS_FILE), dtype="<f4", mode="r", shape=(count, dim)
+        )
+        self.offsets = np.fromfile(os.path.join(index_dir, RULINGS_OFFSETS_FILE), dtype="<i8")
+        self.stage2_rows = np.fromfile(os.path.join(index_dir, RULINGS_ROWS_FILE), dtype="<i4")
+        # Rulings considered in the second stage
+        self.candidate_rulings = candidate_rulings
+
+    def __len__(self):
+        return len(self.flat)
+
+    def get_vectors(self, ids: list[str]) -> list[np.ndarray | None]:
+        return self.flat.get_vectors(ids)
+
+    # Rulings with at least one second-stage row passing `mask`
+    def _allowed_rulings(self, mask: np.ndarray) -> np.ndarray:
+        return np.logical_or.reduceat(mask[self.stage2_rows], self.offsets[:-1])
+
+    # Same contract as LocalVectorIndex.search, over the second-stage chunks of
+    # the `candidate_rulings` rulings whose representative vector is closest.
+    def search(self, vector: np.ndarray, match_count: int = 50, match_threshold: float = 0.7,
+               filters: dict | None = None) -> list[dict]:
+        if len(self.ruling_vectors) == 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        mask = self.flat.metadata.mask(filters) if filters else None
+        ruling_scores = self.ruling_vectors @ query
+        if mask is not None:
+            ruling_scores[~self._allowed_rulings(mask)] = -np.inf
+
+        n = min(self.candidate_rulings, len(ruling_scores))
+        rulings = np.argpartition(-ruling_scores, n - 1)[:n]
+        rulings = rulings[np.isfinite(ruling_scores[rulings])]
+        if len(rulings) == 0:
+            return []
+
+        rows = np.concatenate([self.stage2_rows[self.offsets[r]:self.offsets[r + 1]] for r in rulings])
+        if mask is not None:
+            rows = rows[mask[rows]]
+        # Ascending rows keep the gather from the memory map sequential
+        rows = np.sort(rows)
+        scores = np.asarray(self.flat.vectors[rows]) @ query
+
+        k = min(match_count, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            similarity = float(scores[i])
+            if 1 - similarity >= match_threshold:
+                break
+            row = self.flat.rows[rows[i]]
+            results.append({
+                "id": row["id"],
+                "ecli": row["ecli"],
+                "content": row["content"],
+                "metadata": row["metadata"],
+                "similarity": similarity,
+            })
+        return results
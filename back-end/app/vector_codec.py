@@ -0,0 +1,38 @@
+import base64
+import json
+import numpy as np
+
+# Wire formats for query vectors sent to the match RPCs:
+#   - text:   pgvector literal "[0.1, 0.2, ...]" (~20 KB for 1024 dims)
+#   - f32b64: base64 of little-endian float32 (~5.5 KB, lossless)
+#   - f16b64: base64 of little-endian float16 (~2.7 KB, ~3 significant digits)
+# The base64 formats are decoded in Postgres by decode_query_vector
+# (_utils/supabase_decode_query_vector.sql).
+VECTOR_ENCODINGS = ("text", "f32b64", "f16b64")
+
+_DTYPES = {"f32b64": "<f4", "f16b64": "<f2"}
+
+
+def encode_vector(vector: np.ndarray, encoding: str = "text") -> str:
+    if encoding == "text":
+        return f"[{', '.join(map(str, np.asarray(vector).tolist()))}]"
+    if encoding not in _DTYPES:
+        raise ValueError(f"Unknown vector encoding: {encoding}")
+    data = np.ascontiguousarray(vector, dtype=_DTYPES[encoding]).tobytes()
+    return base64.b64encode(data).decode("ascii")
+
+
+def decode_vector(payload: str, encoding: str = "text") -> np.ndarray:
+    if encoding == "text":
+        return np.array(json.loads(payload), dtype=np.float32)
+    if encoding not in _DTYPES:
+        raise ValueError(f"Unknown vector encoding: {encoding}")
+    return np.frombuffer(base64.b64decode(payload), dtype=_DTYPES[encoding]).astype(np.float32)
+
+
+# The vector as the database sees it after decoding; the local backends search
+# with this so every backend ranks chunks with the same (possibly rounded) query.
+def roundtrip_vector(vector: np.ndarray, encoding: str = "text") -> np.ndarray:
+    if encoding == "f16b64":
+        return np.asarray(vector, dtype=np.float16).astype(np.float32)
+    return np.asarray(vector, dtype=np.float32)
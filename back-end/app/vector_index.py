@@ -0,0 +1,238 @@
+import json
+import mmap
+import os
+import numpy as np
+from uuid import uuid4
+from app.metadata_index import MetadataIndex
+
+# On-disk layout of a local vector index directory:
+#  - vectors.f32:   raw little-endian float32 matrix (count x dim), one row per chunk
+#  - chunks.jsonl:  one {"id", "ecli", "content", "metadata"} record per row, same order
+#  - offsets.u64:   little-endian uint64 byte offset of every row's line in
+#                   chunks.jsonl, plus the end of the last line (count + 1 entries)
+#  - manifest.json: {"count", "dim", "model", "corpus_version"}
+# The matrix, the offsets and chunks.jsonl are memory-mapped, so every worker
+# process maps the same files and shares their pages through the OS page cache
+# instead of holding a copy. Rows are parsed only when a search returns them;
+# a worker keeps just the chunk ids in memory.
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.jsonl"
+OFFSETS_FILE = "offsets.u64"
+MANIFEST_FILE = "manifest.json"
+
+
+# Changes whenever the indexed corpus changes; caches keyed on it drop stale entries
+def new_corpus_version() -> str:
+    return uuid4().hex
+
+
+def _row_line(row: dict) -> str:
+    record = {
+        "id": row["id"],
+        "ecli": row["ecli"],
+        "content": row["content"],
+        "metadata": row["metadata"],
+    }
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+# Read-only, list-like view of the rows in chunks.jsonl: rows[i] parses one line
+# through the offsets, iteration streams the file. Indexes written before
+# offsets.u64 existed get their offsets from one scan of the file.
+class ChunkRows:
+    def __init__(self, index_dir: str, count: int):
+        self.count = count
+        chunks_path = os.path.join(index_dir, CHUNKS_FILE)
+        offsets_path = os.path.join(index_dir, OFFSETS_FILE)
+        if os.path.exists(offsets_path):
+            self.offsets = np.memmap(offsets_path, dtype="<u8", mode="r", shape=(count + 1,))
+        else:
+            self.offsets = self._scan_offsets(chunks_path, count)
+
+        end = int(self.offsets[count])
+        with open(chunks_path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if end else b""
+
+    @staticmethod
+    def _scan_offsets(path: str, count: int) -> np.ndarray:
+        offsets = np.zeros(count + 1, dtype="<u8")
+        with open(path, "rb") as f:
+            for i in range(count):
+                line = f.readline()
+                if not line:
+                    raise RuntimeError(f"{path} has fewer than {count} rows")
+                offsets[i + 1] = offsets[i] + len(line)
+        return offsets
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i) -> dict:
+        i = int(i)
+        if not -self.count <= i < self.count:
+            raise IndexError(i)
+        i %= self.count
+        return json.loads(self._data[int(self.offsets[i]):int(self.offsets[i + 1])])
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+
+# Streams rows into `index_dir` batch by batch, so building the index needs no
+# more memory than one batch. Rows go to "*.partial" files that replace the live
+# ones in finish() (manifest last), so readers never see a half-written index.
+# `resume` ({"rows", "chunks_bytes"} from offsets) truncates the partial files
+# back to a checkpoint and continues from there.
+class VectorIndexWriter:
+    def __init__(self, index_dir: str, dim: int, resume: dict | None = None):
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = index_dir
+        self.dim = dim
+        self.vectors_path = os.path.join(index_dir, VECTORS_FILE + ".partial")
+        self.chunks_path = os.path.join(index_dir, CHUNKS_FILE + ".partial")
+        self.offsets_path = os.path.join(index_dir, OFFSETS_FILE + ".partial")
+
+        if resume:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(resume["rows"] * dim * 4)
+            with open(self.chunks_path, "r+b") as f:
+                f.truncate(resume["chunks_bytes"])
+            if os.path.exists(self.offsets_path):
+                with open(self.offsets_path, "r+b") as f:
+                    f.truncate(resume["rows"] * 8)
+            else:
+                # Checkpoint from before offsets.u64 was written
+                ChunkRows._scan_offsets(self.chunks_path, resume["rows"])[:-1].tofile(self.offsets_path)
+            self.count = resume["rows"]
+            self._end = resume["chunks_bytes"]
+        else:
+            self.count = 0
+            self._end = 0
+        mode = "ab" if resume else "wb"
+        self._vectors = open(self.vectors_path, mode)
+        self._chunks = open(self.chunks_path, mode)
+        self._offsets = open(self.offsets_path, mode)
+
+    def append(self, rows: list[dict], embeddings: np.ndarray):
+        matrix = np.ascontiguousarray(embeddings, dtype="<f4")
+        if matrix.shape != (len(rows), self.dim):
+            raise ValueError(f"Expected {len(rows)} x {self.dim} embeddings, got shape {matrix.shape}")
+        matrix.tofile(self._vectors)
+        lines = [_row_line(row).encode("utf-8") for row in rows]
+        starts = self._end + np.cumsum([0] + [len(line) for line in lines], dtype=np.uint64)
+        starts[:-1].astype("<u8").tofile(self._offsets)
+        self._chunks.write(b"".join(lines))
+        self._end = int(starts[-1])
+        self.count += len(rows)
+
+    # Position after the rows appended so far; pass it back as `resume`
+    def offsets(self) -> dict:
+        for f in (self._vectors, self._chunks, self._offsets):
+            f.flush()
+        return {"rows": self.count, "chunks_bytes": self._end}
+
+    def close(self):
+        for f in (self._vectors, self._chunks, self._offsets):
+            f.close()
+
+    # Publishes the partial files as the index and returns the new manifest
+    def finish(self, model_name: str, corpus_version: str | None = None) -> dict:
+        np.array([self._end], dtype="<u8").tofile(self._offsets)
+        for f in (self._vectors, self._chunks, self._offsets):
+            f.flush()
+            os.fsync(f.fileno())
+        self.close()
+        os.replace(self.vectors_path, os.path.join(self.index_dir, VECTORS_FILE))
+        os.replace(self.chunks_path, os.path.join(self.index_dir, CHUNKS_FILE))
+        os.replace(self.offsets_path, os.path.join(self.index_dir, OFFSETS_FILE))
+
+        manifest = {
+            "count": self.count,
+            "dim": self.dim,
+            "model": model_name,
+            "corpus_version": corpus_version or new_corpus_version(),
+        }
+        with open(os.path.join(self.index_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+class LocalVectorIndex:
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        count, dim = self.manifest["count"], self.manifest["dim"]
+        self.vectors = np.memmap(
+            os.path.join(index_dir, VECTORS_FILE), dtype="<f4", mode="r", shape=(count, dim)
+        )
+
+        self.rows = ChunkRows(index_dir, count)
+        self.id_to_row = {row["id"]: i for i, row in enumerate(self.rows)}
+        self._metadata = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Returns the stored vector for each chunk id (None for unknown ids).
+    def get_vectors(self, ids: list[str]) -> list[np.ndarray | None]:
+        return [
+            np.array(self.vectors[self.id_to_row[i]]) if i in self.id_to_row else None
+            for i in ids
+        ]
+
+    # Built on the first filtered query
+    @property
+    def metadata(self) -> MetadataIndex:
+        if self._metadata is None:
+            self._metadata = MetadataIndex(self.rows)
+        return self._metadata
+
+    # Scores the rows that pass `filters` (see MetadataIndex), or every row without
+    # filters. Returns (row numbers, scores); row numbers are None for a full scan.
+    def score_rows(self, query: np.ndarray, filters: dict | None = None) -> tuple[np.ndarray | None, np.ndarray]:
+        mask = self.metadata.mask(filters) if filters else None
+        if mask is None:
+            return None, self.vectors @ query
+
+        rows = np.flatnonzero(mask)
+        if len(rows) > len(mask) // 2:
+            # Broad filter: one sequential scan is cheaper than gathering most rows
+            return rows, (self.vectors @ query)[rows]
+        return rows, np.asarray(self.vectors[rows]) @ query
+
+    # Mirrors the match_case_chunks RPC: rows whose cosine distance is below
+    # `match_threshold`, ordered by similarity, at most `match_count` of them.
+    # Only rows passing the metadata `filters` are scored.
+    def search(self, vector: np.ndarray, match_count: int = 50, match_threshold: float = 0.7,
+               filters: dict | None = None) -> list[dict]:
+        if not self.rows:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        rows, scores = self.score_rows(query, filters)
+        k = min(match_count, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for i in top:
+            similarity = float(scores[i])
+            if 1 - similarity >= match_threshold:
+                break
+            row = self.rows[i if rows is None else rows[i]]
+            results.append({
+                "id": row["id"],
+                "ecli": row["ecli"],
+                "content": row["content"],
+                "metadata": row["metadata"],
+                "similarity": similarity,
+            })
+        return results
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the app package the same way the pipeline scripts do
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
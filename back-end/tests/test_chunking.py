@@ -0,0 +1,61 @@
+import pytest
+from app.chunking import Chunker
+
+# Expected chunks were produced by the previous re-tokenizing implementation
+# (_pipeline/1_chunk_json_data.py before Chunker) with the same tokenizer and
+# bounds; Chunker must reproduce them exactly.
+MIN_TOKENS = 4
+MAX_TOKENS = 8
+
+
+# One token per whitespace-separated word, so "a b" counts count(a) + count(b)
+# like the e5 tokenizer does
+class WhitespaceTokenizer:
+    def __call__(self, texts, add_special_tokens=False, return_attention_mask=False):
+        return {"input_ids": [text.split() for text in texts]}
+
+    def tokenize(self, text):
+        return text.split()
+
+    def convert_tokens_to_string(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def chunker():
+    return Chunker(WhitespaceTokenizer(), MIN_TOKENS, MAX_TOKENS)
+
+
+@pytest.mark.parametrize("paragraphs, expected", [
+    # Small paragraphs are merged until they reach min_tokens
+    (["a b", "c d e", "f g h i j"], ["a b c d e", "f g h i j"]),
+    # Long paragraphs are packed by sentence; a short tail joins the last chunk
+    (
+        ["One two three. Four five six seven. Eight nine ten eleven twelve. Thirteen."],
+        ["One two three. Four five six seven.", "Eight nine ten eleven twelve. Thirteen."],
+    ),
+    (
+        ["Alpha beta gamma delta epsilon. Zeta eta theta iota kappa. Lambda mu."],
+        ["Alpha beta gamma delta epsilon.", "Zeta eta theta iota kappa. Lambda mu."],
+    ),
+    # A short tail that would overflow the last chunk is dropped
+    (["a1 a2 a3 a4 a5 a6 a7. b1 b2 b3."], ["a1 a2 a3 a4 a5 a6 a7."]),
+    # A single sentence over max_tokens is truncated
+    (["w1 w2 w3 w4 w5 w6 w7 w8 w9 w10 w11 w12"], ["w1 w2 w3 w4 w5 w6 w7 w8"]),
+    # A chunk below min_tokens takes the next sentence and is truncated
+    (["Tiny bit. This sentence is far too long to fit in one chunk at all."], ["Tiny bit. This sentence is far too long"]),
+    (["Short. s2 s3 s4 s5 s6 s7 s8 s9 s10 s11."], ["Short. s2 s3 s4 s5 s6 s7 s8"]),
+    # Small paragraphs left over before a large one, or at the end, are dropped
+    (["p q r s t", "x y"], ["p q r s t"]),
+    (["m1 m2", "n1 n2 n3 n4 n5 n6", "o1"], ["n1 n2 n3 n4 n5 n6"]),
+])
+def test_chunk_paragraphs_matches_previous_implementation(chunker, paragraphs, expected):
+    assert chunker.chunk_paragraphs(paragraphs) == expected
+
+
+def test_cached_counts_do_not_change_chunks(chunker):
+    paragraphs = ["One two three. Four five six seven. Eight nine ten eleven twelve. Thirteen."]
+    first = chunker.chunk_paragraphs(paragraphs)
+    assert chunker.chunk_paragraphs(paragraphs) == first
+    chunker.reset()
+    assert chunker.chunk_paragraphs(paragraphs) == first
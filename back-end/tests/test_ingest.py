@@ -0,0 +1,102 @@
+import json
+import numpy as np
+from app.ingest import Checkpoint, chunk_id, plan_ingestion
+from app.vector_index import LocalVectorIndex, VectorIndexWriter
+
+MODEL = "intfloat/multilingual-e5-large"
+DIM = 4
+
+
+def record(text: str, index: int = 0, **metadata) -> dict:
+    return {
+        "ecli": "ECLI:NL:HR:2024:1",
+        "text": text,
+        "metadata": {"section": "OVERWEGINGEN", "chunk_index": index, "sub_chunk_index": 0, **metadata},
+    }
+
+
+def test_chunk_id_is_stable_and_content_keyed():
+    assert chunk_id(record("tekst"), MODEL) == chunk_id(record("tekst"), MODEL)
+    # Metadata outside the content hash does not re-key a chunk
+    assert chunk_id(record("tekst", court="Hoge Raad"), MODEL) == chunk_id(record("tekst"), MODEL)
+    assert chunk_id(record("andere tekst"), MODEL) != chunk_id(record("tekst"), MODEL)
+    assert chunk_id(record("tekst", index=1), MODEL) != chunk_id(record("tekst"), MODEL)
+    assert chunk_id(record("tekst"), "other-model") != chunk_id(record("tekst"), MODEL)
+
+
+def test_plan_ingestion_added_changed_and_removed_rows():
+    kept, changed, removed = record("blijft", 0), record("oud", 1), record("weg", 2)
+    edited, added = record("nieuw", 1), record("toegevoegd", 3)
+    stored = {chunk_id(r, MODEL) for r in (kept, changed, removed)}
+    wanted = [chunk_id(r, MODEL) for r in (kept, edited, added)]
+
+    plan = plan_ingestion(wanted, stored, local=set(stored))
+
+    assert plan["embed"] == [chunk_id(edited, MODEL), chunk_id(added, MODEL)]
+    assert plan["fetch"] == []
+    assert plan["upsert"] == [chunk_id(edited, MODEL), chunk_id(added, MODEL)]
+    assert plan["delete"] == sorted([chunk_id(changed, MODEL), chunk_id(removed, MODEL)])
+    assert plan["unchanged"] == 1
+
+
+def test_plan_ingestion_fetches_vectors_missing_locally():
+    ids = [chunk_id(record(f"tekst {i}", i), MODEL) for i in range(3)]
+
+    plan = plan_ingestion(ids, stored=set(ids), local={ids[0]})
+
+    assert plan["embed"] == []
+    assert plan["fetch"] == ids[1:]
+    assert plan["upsert"] == []
+    assert plan["delete"] == []
+    assert plan["unchanged"] == 3
+
+
+def test_checkpoint_resumes_only_the_same_run(tmp_path):
+    path = str(tmp_path / "ingest_checkpoint.json")
+    Checkpoint(path).save(fingerprint="abc", model=MODEL, batch_size=64, batches=2, rows=128)
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.resumable("abc", MODEL, 64)["rows"] == 128
+    assert checkpoint.resumable("def", MODEL, 64) is None
+    assert checkpoint.resumable("abc", "other-model", 64) is None
+    assert checkpoint.resumable("abc", MODEL, 32) is None
+
+    checkpoint.clear()
+    assert Checkpoint(path).resumable("abc", MODEL, 64) is None
+
+
+def rows_and_vectors(start: int, count: int) -> tuple[list[dict], np.ndarray]:
+    rows = [
+        {"id": f"id-{i}", "ecli": f"ECLI:NL:HR:2024:{i}", "content": f"chunk {i}", "metadata": {"section": "BESLISSING"}}
+        for i in range(start, start + count)
+    ]
+    vectors = np.arange(start * DIM, (start + count) * DIM, dtype=np.float32).reshape(count, DIM)
+    return rows, vectors
+
+
+def test_writer_resumes_from_checkpoint_offsets(tmp_path):
+    expected_dir, resumed_dir = str(tmp_path / "expected"), str(tmp_path / "resumed")
+
+    writer = VectorIndexWriter(expected_dir, DIM)
+    for start in (0, 3):
+        writer.append(*rows_and_vectors(start, 3))
+    writer.finish(MODEL, corpus_version="v1")
+
+    # Interrupted after the first batch was checkpointed and the second written
+    writer = VectorIndexWriter(resumed_dir, DIM)
+    writer.append(*rows_and_vectors(0, 3))
+    offsets = json.loads(json.dumps(writer.offsets()))
+    writer.append(*rows_and_vectors(3, 3))
+    writer.close()
+
+    writer = VectorIndexWriter(resumed_dir, DIM, resume=offsets)
+    writer.append(*rows_and_vectors(3, 3))
+    writer.finish(MODEL, corpus_version="v1")
+
+    expected, resumed = LocalVectorIndex(expected_dir), LocalVectorIndex(resumed_dir)
+    assert resumed.manifest == expected.manifest
+    assert list(resumed.rows) == list(expected.rows)
+    assert resumed.id_to_row == {f"id-{i}": i for i in range(6)}
+    np.testing.assert_array_equal(resumed.vectors, expected.vectors)
+    for name in ("vectors.f32", "chunks.jsonl", "offsets.u64"):
+        assert (tmp_path / "resumed" / name).read_bytes() == (tmp_path / "expected" / name).read_bytes()